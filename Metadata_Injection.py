@@ -1,390 +1,1135 @@
-import gradio as gr
+import argparse
+import hashlib
+import itertools
 import json
-from pathlib import Path
+import os
+import posixpath
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
 from collections import Counter
-from safetensors import safe_open
-from safetensors.torch import save_file
+from contextlib import nullcontext, ExitStack
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from safetensors_io import (
+    read_safetensors_header,
+    read_safetensors_data_offset,
+    build_safetensors_header,
+    output_alignment,
+    recover_header_journal,
+    rewrite_safetensors_metadata,
+    patch_safetensors_metadata_in_place,
+    metadata_fits_in_place,
+    hash_payload,
+    known_model_hash,
+    MODEL_HASH_KEY,
+    LEGACY_HASH_KEY,
+)
+from scan_cache import cache_path_for, scan_with_cache
+from tag_counting import TagCounter, SpaceSavingCounter
+from progress import OperationCancelled, NestedProgress
+from dataset_listing import list_dataset_folder, IMAGE_EXTENSIONS, CAPTION_EXTENSION
+from image_probe import probe_image_sizes, summarize_resolutions
+from job_queue import estimate_injection_memory
+from dataset_archive import is_dataset_archive, archive_stem, iter_archive_members
+from caption_manifest import is_caption_manifest, find_folder_manifest, manifest_dataset_name, iter_manifest_captions
+from instrumentation import timed, profiled, append_timings_log
+from tag_budget import TRUNCATION_KEY, truncate_tag_frequency, truncation_placeholder
+from tag_normalization import make_tag_normalizer
+
+# The approximate scan tracks this many times more tags than it reports, which
+# keeps the reported top entries' error well below the worst-case bound.
+APPROX_CAPACITY_FACTOR = 4
+# Captions handed to the reader pool at a time in streaming scans
+READ_BATCH_SIZE = 1024
+
+# Kohya dataset subfolders are named "<repeats>_<name>", e.g. "10_my_character"
+KOHYA_FOLDER_PATTERN = re.compile(r"^(\d+)_(.+)$")
+
+def read_caption(txt_file):
+    """Return the text of one caption file, or None if it can't be read."""
+    try:
+        with open(txt_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        return None
+
+def read_caption_tags(txt_file):
+    """Return the tags of one caption file, or None if it can't be read."""
+    content = read_caption(txt_file)
+    if content is None:
+        return None
+    return list(filter(None, map(str.strip, content.split(','))))
+
+def count_caption_files(txt_files, progress=None, preview=True, stats=None, normalizer=None):
+    """Count tags over a list of caption files, returning (TagCounter, number of files read).
+    
+    With stats (a RunStats), time spent reading and parsing captions is
+    recorded as the "read" and "parse" stages. Tags are cleaned by normalizer
+    (a TagNormalizer) as they are parsed.
+    """
+    tag_counter = TagCounter(normalizer)
+    image_count = 0
+    clock = time.perf_counter
+    read_time = 0.0
+    parse_time = 0.0
+    caption_bytes = 0
+    
+    for txt_file in txt_files:
+        start = clock()
+        content = read_caption(txt_file)
+        read_time += clock() - start
+        if progress is not None:
+            # Caption length stands in for the byte count to avoid an extra stat
+            progress.advance(1, len(content) if content else 0)
+            if preview and progress.wants_preview():
+                progress.set_preview(tag_counter.to_dict())
+        if content is None:
+            continue
+        start = clock()
+        tag_counter.add_caption(content)
+        parse_time += clock() - start
+        image_count += 1
+        caption_bytes += len(content)
+    
+    if stats is not None:
+        stats.add_time("read", read_time)
+        stats.add_time("parse", parse_time)
+        stats.count("caption_bytes", caption_bytes)
+    return tag_counter, image_count
+
+def count_caption_files_parallel(txt_files, workers, progress=None, stats=None, normalizer=None):
+    # Contiguous chunks merged back in order keep both the counts and the
+    # first-seen tag order identical to the serial path.
+    chunk_count = min(len(txt_files), workers * 4) or 1
+    chunk_size = -(-len(txt_files) // chunk_count)
+    chunks = [txt_files[i:i + chunk_size] for i in range(0, len(txt_files), chunk_size)]
+    
+    tag_counter = TagCounter()
+    image_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda chunk: count_caption_files(chunk, progress, preview=False, stats=stats,
+                                                                  normalizer=normalizer), chunks)
+        for chunk_counter, chunk_images in results:
+            with timed(stats, "merge"):
+                tag_counter.merge(chunk_counter)
+            image_count += chunk_images
+            if progress is not None and progress.wants_preview():
+                progress.set_preview(tag_counter.to_dict())
+    
+    return tag_counter, image_count
+
+def iter_caption_files(dataset_path, counts=None):
+    """Lazily yield the caption paths directly inside dataset_path.
+    
+    Images seen along the way are tallied in counts["images"] when a dict is
+    given, so streaming scans still learn the image count from the same pass.
+    """
+    with os.scandir(dataset_path) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            ext = os.path.splitext(name)[1].lower()
+            if ext == CAPTION_EXTENSION and entry.is_file():
+                yield entry.path
+            elif counts is not None and ext in IMAGE_EXTENSIONS and entry.is_file():
+                counts["images"] = counts.get("images", 0) + 1
+
+def iter_captions(txt_files, workers=1):
+    """Yield caption texts (None for unreadable files), reading in parallel in bounded batches."""
+    if not workers or workers <= 1:
+        yield from map(read_caption, txt_files)
+        return
+    
+    txt_files = iter(txt_files)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(itertools.islice(txt_files, READ_BATCH_SIZE))
+            if not batch:
+                break
+            yield from executor.map(read_caption, batch)
+
+def make_approximate_counter(top_n, normalizer=None):
+    """The bounded-memory counter every approximate top-N scan counts into."""
+    return SpaceSavingCounter(int(top_n) * APPROX_CAPACITY_FACTOR, normalizer)
+
+def approximate_note(tag_counter, tag_frequencies):
+    """Status note of an approximate scan: how many tags were kept and how far their counts can be off."""
+    errors = tag_counter.errors()
+    max_error = max((errors[tag] for tag in tag_frequencies), default=0)
+    return (f"; approximate top {len(tag_frequencies)} tags "
+            f"(counts too high by at most {max_error}, worst-case bound {tag_counter.error_bound()} "
+            f"over {tag_counter.total} tag occurrences)")
+
+def count_caption_files_approximate(txt_files, top_n, workers=1, progress=None, normalizer=None):
+    """Approximate top-N tag counting in bounded memory, returning (SpaceSavingCounter, number of files read)."""
+    tag_counter = make_approximate_counter(top_n, normalizer)
+    image_count = 0
+    
+    for content in iter_captions(txt_files, workers):
+        if progress is not None:
+            progress.advance(1, len(content) if content else 0)
+            if progress.wants_preview():
+                progress.set_preview(tag_counter.top(progress.preview_size))
+        if content is None:
+            continue
+        tag_counter.add_caption(content)
+        image_count += 1
+    
+    return tag_counter, image_count
+
+def parse_kohya_folder_name(name):
+    """Return the repeat count of a Kohya "N_name" folder, or None for other names."""
+    match = KOHYA_FOLDER_PATTERN.match(name)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+def list_kohya_folders(dataset_root):
+    """List the N_name subfolders of dataset_root in one scandir pass as (name, path, n_repeats)."""
+    folders = []
+    with os.scandir(dataset_root) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            n_repeats = parse_kohya_folder_name(entry.name)
+            if n_repeats is not None:
+                folders.append((entry.name, Path(entry.path), n_repeats))
+    return sorted(folders)
+
+def is_kohya_dataset(dataset_root):
+    try:
+        return bool(list_kohya_folders(dataset_root))
+    except OSError:
+        return False
+
+def count_caption_value(tag_counter, value, separator=","):
+    """Count one manifest caption, either a separator-joined string or a list of tags.
+    
+    Returns False when the row has no caption.
+    """
+    if isinstance(value, str):
+        if separator == ",":
+            tag_counter.add_caption(value)
+        else:
+            tag_counter.add_tags(filter(None, map(str.strip, value.split(separator))))
+        return True
+    if isinstance(value, (list, tuple)):
+        tag_counter.add_tags(filter(None, (str(tag).strip() for tag in value)))
+        return True
+    return False
+
+def describe_folder_scan(folder_scan):
+    """Human readable image/caption summary of one scanned folder."""
+    text = f"Found {folder_scan['img_count']} images"
+    details = []
+    if folder_scan["missing_captions"]:
+        details.append(f"{folder_scan['missing_captions']} without captions")
+    if folder_scan["orphan_captions"]:
+        details.append(f"{folder_scan['orphan_captions']} orphan caption file(s)")
+    if details:
+        text += f" ({', '.join(details)})"
+    return text + folder_scan["note"]
+
+def describe_dataset_folders(dataset_folders):
+    """Summary of a multi-folder scan with the per-folder breakdown."""
+    total_images = sum(folder["img_count"] for folder in dataset_folders.values())
+    unique_tags = len(merge_folder_tags(dataset_folders))
+    breakdown = "; ".join(f"{name}: {describe_folder_scan(folder)}" for name, folder in dataset_folders.items())
+    return (f"Found {total_images} images in {len(dataset_folders)} folders "
+            f"with {unique_tags} unique tags ({breakdown})")
+
+def merge_folder_tags(dataset_folders):
+    """Combine per-folder tag frequencies into one {tag: count} dict."""
+    merged = TagCounter()
+    for folder in dataset_folders.values():
+        merged.add_counts(folder["tag_frequency"])
+    return merged.to_dict()
+
+# Metadata key holding the fingerprint of the inputs an output was written from
+FINGERPRINT_KEY = "injection_fingerprint"
+UP_TO_DATE_STATUS = "[OK] Up to date"
+
+def injection_fingerprint(header, data_length, metadata, source_stat=None, options=()):
+    """Hash everything an injected output depends on: the source tensor layout, payload size and final metadata.
+    
+    The payload bytes themselves are not hashed. Copies also hash the
+    source's (st_size, st_mtime_ns) as source_stat, so a source rewritten
+    with the same layout but new weights is never taken as up to date. The
+    model hashes are derived from the payload, so they are left out, and
+    whether they are written at all goes in through options (names of the
+    write options that change the output bytes).
+    """
+    digest = hashlib.sha256()
+    tensors = {name: entry for name, entry in header.items() if name != "__metadata__"}
+    digest.update(json.dumps(tensors, sort_keys=True).encode('utf-8'))
+    digest.update(str(data_length).encode('ascii'))
+    if source_stat is not None:
+        digest.update("source {} {}".format(*source_stat).encode('ascii'))
+    digest.update(("options " + " ".join(sorted(options))).encode('ascii'))
+    metadata = {key: value for key, value in metadata.items()
+                if key not in (FINGERPRINT_KEY, MODEL_HASH_KEY, LEGACY_HASH_KEY)}
+    digest.update(json.dumps(metadata, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def is_output_up_to_date(path, fingerprint, data_length):
+    """True when path holds a complete output written from inputs with this fingerprint."""
+    try:
+        header, data_offset = read_safetensors_header(path)
+        # A copy that was interrupted has the new header but a short payload
+        return ((header.get("__metadata__") or {}).get(FINGERPRINT_KEY) == fingerprint
+                and os.path.getsize(path) - data_offset == data_length)
+    except (OSError, ValueError):
+        return False
 
 class MetadataInjector:
-    def __init__(self):
+    def __init__(self, dataset_dir=None, output_dir=None, cache_dir=None, scheduler=None):
         self.base_dir = Path(__file__).parent
-        self.dataset_dir = self.base_dir / "Model to Repair"
-        self.output_dir = self.base_dir / "Updated LoRA"
-        self.dataset_dir.mkdir(exist_ok=True)
-        self.output_dir.mkdir(exist_ok=True)
+        self.dataset_dir = Path(dataset_dir) if dataset_dir else self.base_dir / "Model to Repair"
+        self.output_dir = Path(output_dir) if output_dir else self.base_dir / "Updated LoRA"
+        self.cache_dir = Path(cache_dir) if cache_dir else self.base_dir / ".scan_cache"
+        # Optional InjectionScheduler shared by every caller of this injector
+        self.scheduler = scheduler
+        self.dataset_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
         
-    def scan_dataset(self, subfolder_name):
+    def resolve_dataset_path(self, subfolder_name):
         # Check if it's an absolute path or a subfolder name
         if Path(subfolder_name).is_absolute():
-            dataset_path = Path(subfolder_name)
-        else:
-            dataset_path = self.dataset_dir / subfolder_name
+            return Path(subfolder_name)
+        return self.dataset_dir / subfolder_name
+    
+    def scan_dataset(self, subfolder_name, workers=1, use_cache=True, approximate_top=0, progress=None,
+                     probe_resolution=False, caption_column=None, caption_separator=",", stats=None,
+                     normalizer=None):
+        """Scan a dataset into one merged {tag: count} table, returning (tags, status)."""
+        dataset_folders, status = self.scan_dataset_folders(
+            subfolder_name, workers, use_cache, approximate_top, progress, probe_resolution,
+            caption_column, caption_separator, stats, normalizer
+        )
+        if dataset_folders is None:
+            return None, status
+        return merge_folder_tags(dataset_folders), status
+    
+    def scan_dataset_folders(self, subfolder_name, workers=1, use_cache=True, approximate_top=0, progress=None,
+                             probe_resolution=False, caption_column=None, caption_separator=",", stats=None,
+                             normalizer=None):
+        """Scan a dataset into the per-folder structure inject_metadata(dataset_folders=...) takes.
+        
+        Kohya-style roots with N_name subfolders give one entry per subfolder,
+        a plain caption folder gives a single "1_<name>" entry. zip/tar
+        archives are read in place, laid out the same way. A JSONL/CSV/Parquet
+        caption manifest, or a folder whose captions live in a metadata.*
+        manifest, gives a single entry too. stats (a RunStats) collects
+        per-stage timings and counters. normalizer (a TagNormalizer) cleans
+        tags as they are counted; cached scans keep the raw tags, so changing
+        the rules never needs a rescan.
+        """
+        with profiled("scan", stats):
+            result = self._scan_dataset_folders(subfolder_name, workers, use_cache, approximate_top, progress,
+                                                probe_resolution, caption_column, caption_separator, stats,
+                                                normalizer)
+        if stats is not None:
+            stats.finish()
+            if result[0] is not None:
+                stats.count("folders", len(result[0]))
+        return result
+    
+    def _scan_dataset_folders(self, subfolder_name, workers, use_cache, approximate_top, progress,
+                              probe_resolution, caption_column, caption_separator, stats, normalizer):
+        dataset_path = self.resolve_dataset_path(subfolder_name)
+        
+        if is_caption_manifest(dataset_path):
+            return self.scan_manifest(dataset_path, caption_column, caption_separator, approximate_top, progress, stats,
+                                      normalizer)
+        
+        if is_dataset_archive(dataset_path):
+            return self.scan_archive(dataset_path, approximate_top, progress, stats, normalizer)
+        
+        if is_kohya_dataset(dataset_path):
+            return self.scan_kohya_dataset(subfolder_name, workers, use_cache, approximate_top, progress,
+                                           probe_resolution, stats, normalizer)
         
         if not dataset_path.exists():
             return None, f"[ERROR] Dataset folder not found: {dataset_path}"
         
-        tag_counter = Counter()
-        image_count = 0
-        
-        for txt_file in dataset_path.glob("*.txt"):
-            try:
-                with open(txt_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    tags = [tag.strip() for tag in content.split(',') if tag.strip()]
-                    tag_counter.update(tags)
-                    image_count += 1
-            except Exception as e:
-                continue
+        try:
+            folder_scan = self._scan_folder(dataset_path, workers, use_cache, approximate_top, progress,
+                                            probe_resolution, stats, normalizer)
+        except OperationCancelled:
+            return None, "[CANCELLED] Scan cancelled"
         
-        if image_count == 0:
+        if folder_scan["caption_count"] == 0:
+            manifest_path = find_folder_manifest(dataset_path)
+            if manifest_path is not None:
+                return self.scan_manifest(manifest_path, caption_column, caption_separator, approximate_top,
+                                          progress, stats, normalizer)
             return None, f"[ERROR] No caption files found in {dataset_path}"
         
-        return dict(tag_counter), f"[OK] Found {image_count} images with {len(tag_counter)} unique tags"
+        folder_scan["n_repeats"] = 1
+        return {"1_" + dataset_path.name: folder_scan}, "[OK] " + describe_folder_scan(folder_scan)
     
-    def inject_metadata(self, lora_filename, subfolder_name, tag_frequencies):
-        lora_path = self.dataset_dir / lora_filename
+    def scan_manifest(self, manifest_path, caption_column=None, caption_separator=",", approximate_top=0, progress=None,
+                      stats=None, normalizer=None):
+        """Count the captions of a JSONL/CSV/Parquet manifest in one sequential read.
         
-        if not lora_path.exists():
-            return None, f"[ERROR] LoRA file not found: {lora_path}"
+        Every row is one image. Returns ({"1_<name>": folder scan}, status) like
+        scan_dataset_folders.
+        """
+        manifest_path = Path(manifest_path)
+        approximate = bool(approximate_top and approximate_top > 0)
+        tag_counter = make_approximate_counter(approximate_top, normalizer) if approximate else TagCounter(normalizer)
+        rows = 0
+        captioned = 0
         
+        if progress is not None:
+            progress.start(f"Reading captions from {manifest_path.name}", bytes_total=manifest_path.stat().st_size)
         try:
-            tensors = {}
-            metadata = {}
-            
-            with safe_open(lora_path, framework="pt", device="cpu") as f:
-                metadata = f.metadata() or {}
-                for key in f.keys():
-                    tensors[key] = f.get_tensor(key)
-            
-            dataset_dirs = {
-                "1_" + subfolder_name: {
-                    "n_repeats": 1,
-                    "img_count": sum(tag_frequencies.values())
-                }
-            }
-            
-            tag_freq = {
-                "1_" + subfolder_name: tag_frequencies
-            }
-            
-            metadata["ss_tag_frequency"] = json.dumps(tag_freq)
-            metadata["ss_dataset_dirs"] = json.dumps(dataset_dirs)
-            metadata["ss_resolution"] = "1024,1024"
-            metadata["ss_num_train_images"] = str(dataset_dirs["1_" + subfolder_name]["img_count"])
-            
-            output_filename = lora_path.stem + "_with_tags.safetensors"
-            output_path = self.output_dir / output_filename
-            
-            save_file(tensors, str(output_path), metadata=metadata)
-            
-            return str(output_path), f"[OK] Successfully created: {output_filename}"
-            
+            with timed(stats, "read"):
+                for value, nbytes in iter_manifest_captions(manifest_path, caption_column):
+                    rows += 1
+                    if count_caption_value(tag_counter, value, caption_separator or ","):
+                        captioned += 1
+                    if progress is not None:
+                        progress.advance(1, nbytes)
+                        if not approximate and progress.wants_preview():
+                            progress.set_preview(tag_counter.to_dict())
+        except OperationCancelled:
+            return None, "[CANCELLED] Scan cancelled"
         except Exception as e:
-            return None, f"[ERROR] Error: {str(e)}"
-
-def live_validate(tags_text, frequency):
-    freq = 1
-    if frequency is not None:
-        try:
-            freq = int(frequency)
-        except ValueError:
-            pass
+            return None, f"[ERROR] Could not read caption manifest {manifest_path.name}: {e}"
+        
+        if not captioned:
+            return None, f"[ERROR] No captions found in {manifest_path.name}"
+        
+        if approximate:
+            tag_frequencies = tag_counter.top(int(approximate_top))
+            note = approximate_note(tag_counter, tag_frequencies)
+        else:
+            tag_frequencies = tag_counter.to_dict()
+            note = f" with {len(tag_frequencies)} unique tags"
+        folder_scan = {
+            "tag_frequency": tag_frequencies,
+            "img_count": rows,
+            "caption_count": captioned,
+            "missing_captions": rows - captioned,
+            "orphan_captions": 0,
+            "n_repeats": 1,
+            "note": note + f" (from {manifest_path.name})",
+        }
+        if stats is not None:
+            stats.count("captions", captioned)
+            stats.count("caption_bytes", manifest_path.stat().st_size)
+            stats.count("tags", len(tag_frequencies))
+        return {"1_" + manifest_dataset_name(manifest_path): folder_scan}, "[OK] " + describe_folder_scan(folder_scan)
     
-    preview = {}
-    status = "<span style='color: #888;'>Enter comma-separated tags to see a live preview</span>"
-    interactive = gr.update(interactive=False)
+    def scan_kohya_dataset(self, subfolder_name, workers=1, use_cache=True, approximate_top=0, progress=None,
+                           probe_resolution=False, stats=None, normalizer=None):
+        """Scan every N_name subfolder of a Kohya-style dataset root concurrently.
+        
+        Returns ({folder name: {"n_repeats", "img_count", "tag_frequency", ...}}, status).
+        """
+        dataset_root = self.resolve_dataset_path(subfolder_name)
+        
+        if not dataset_root.exists():
+            return None, f"[ERROR] Dataset folder not found: {dataset_root}"
+        
+        folders = list_kohya_folders(dataset_root)
+        if not folders:
+            return None, f"[ERROR] No Kohya-style N_name subfolders found in {dataset_root}"
+        
+        workers = max(1, workers or 1)
+        # Spread the workers over the folders first, then over files inside each
+        inner_workers = max(1, workers // len(folders))
+        if progress is not None:
+            progress.start(f"Scanning {len(folders)} dataset folders", items_total=0)
+        
+        def scan_folder(folder):
+            name, path, n_repeats = folder
+            # One handle per folder, so each folder's tag preview adds to the combined one
+            nested = NestedProgress(progress) if progress is not None else None
+            folder_scan = self._scan_folder(path, inner_workers, use_cache, approximate_top, nested, probe_resolution,
+                                            stats, normalizer)
+            folder_scan["n_repeats"] = n_repeats
+            return name, folder_scan
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(workers, len(folders))) as executor:
+                results = list(executor.map(scan_folder, folders))
+        except OperationCancelled:
+            return None, "[CANCELLED] Scan cancelled"
+        
+        dataset_folders = {name: folder_scan for name, folder_scan in results if folder_scan["caption_count"]}
+        
+        if not dataset_folders:
+            return None, f"[ERROR] No caption files found in the subfolders of {dataset_root}"
+        
+        return dataset_folders, "[OK] " + describe_dataset_folders(dataset_folders)
     
-    if tags_text and tags_text.strip():
-        cleaned = tags_text.replace('\n', ',').strip()
-        parts = [p.strip() for p in cleaned.split(',') if p.strip()]
+    def scan_archive(self, archive_path, approximate_top=0, progress=None, stats=None, normalizer=None):
+        """Count the captions of a zip/tar dataset archive without extracting it.
         
-        if parts:
-            if len(parts) == 1 and ' ' in parts[0]:
-                status = "<span style='color: #ff9900;'>🔸 Hint: Use commas to separate tags (e.g., blue hair, red eyes)</span>"
-            else:
-                unique = list(dict.fromkeys(parts))
-                dups = len(parts) - len(unique)
-                dup_note = f"<br><small>{dups} duplicate(s) removed</small>" if dups > 0 else ""
-                preview = {tag: freq for tag in unique}
-                count = len(unique)
-                status = f"<span style='color: green;'>🟢 Ready — {count} unique tag{'s' if count != 1 else ''}{dup_note}</span>"
-                interactive = gr.update(interactive=True)
+        Members in N_name folders become one Kohya entry each; otherwise every
+        caption counts towards a single "1_<archive name>" entry. Returns
+        ({folder name: folder scan}, status) like scan_dataset_folders. The
+        scan cache and image size probing only apply to extracted folders.
+        """
+        archive_path = Path(archive_path)
+        approximate = bool(approximate_top and approximate_top > 0)
+        groups = {}
+        
+        if progress is not None:
+            progress.start(f"Reading captions from {archive_path.name}")
+        try:
+            with timed(stats, "read"):
+                for folder, stem, is_caption, text in iter_archive_members(archive_path):
+                    base = posixpath.basename(folder)
+                    key = base if parse_kohya_folder_name(base) is not None else None
+                    group = groups.get(key)
+                    if group is None:
+                        if approximate:
+                            counter = make_approximate_counter(approximate_top, normalizer)
+                        else:
+                            counter = TagCounter(normalizer)
+                        group = groups[key] = {"counter": counter, "captions": set(), "images": set(),
+                                               "caption_count": 0, "image_count": 0}
+                    
+                    if not is_caption:
+                        group["image_count"] += 1
+                        if not approximate:
+                            group["images"].add((folder, stem))
+                        continue
+                    
+                    if progress is not None:
+                        progress.advance(1, len(text) if text else 0)
+                    if text is None:
+                        continue
+                    group["counter"].add_caption(text)
+                    group["caption_count"] += 1
+                    if not approximate:
+                        group["captions"].add((folder, stem))
+        except OperationCancelled:
+            return None, "[CANCELLED] Scan cancelled"
+        except Exception as e:
+            return None, f"[ERROR] Could not read archive {archive_path.name}: {e}"
+        
+        kohya_groups = {key: group for key, group in groups.items() if key is not None}
+        if kohya_groups:
+            selected = kohya_groups
+        elif None in groups:
+            selected = {"1_" + archive_stem(archive_path): groups[None]}
         else:
-            status = "<span style='color: orange;'>⚠️ No tags detected yet</span>"
-    
-    return preview, status, interactive, preview
-
-def create_ui():
-    injector = MetadataInjector()
-    
-    with gr.Blocks(title="Dataset Metadata Injection Tool") as demo:
-        current_tags = gr.State({})
-        
-        gr.Markdown("""
-        # 🏷️ Dataset Metadata Injection Tool
-        Add Kohya/A1111-compatible tag frequency metadata to your LoRA files
-        """)
-        
-        with gr.Row():
-            # LEFT COLUMN - Steps 1, 2, 3
-            with gr.Column(scale=1):
-                gr.Markdown("### 🔍 Step 1: Configure Paths")
-                
-                # LoRA filename only
-                lora_input = gr.Dropdown(
-                    label="LoRA Filename",
-                    choices=[f.name for f in injector.dataset_dir.glob("*.safetensors")],
-                    value=None,
-                    allow_custom_value=True,
-                    info="Select your original LoRA file in 'Model to Repair'"
-                )
-                
-                manual_mode = gr.Checkbox(
-                    label="Manual trigger word mode (no dataset required)",
-                    value=False,
-                    info="Use this if you don't have the training dataset"
-                )
-                
-                subfolder_input = gr.Dropdown(
-                    label="Dataset Subfolder Name",
-                    choices=[d.name for d in injector.dataset_dir.iterdir() if d.is_dir()],
-                    value=None,
-                    allow_custom_value=True,
-                    info="Select a subfolder or enter a custom path to your dataset",
-                    visible=True
-                )
-                
-                manual_tags_input = gr.Textbox(
-                    label="Trigger Words (comma-separated)",
-                    placeholder="my_character, blue_hair, school_uniform, smiling",
-                    lines=2,
-                    visible=False,
-                    info="Enter your trigger words separated by commas"
-                )
-                
-                tag_frequency_input = gr.Number(
-                    label="Tag Frequency (applies to all tags)",
-                    value=1,
-                    minimum=1,
-                    step=1,
-                    visible=False,
-                    info="How many times each tag appears in your training"
-                )
-                
-                # Button row: Scan and Select Folder
-                with gr.Row():
-                    scan_btn = gr.Button("🔍 Scan Dataset / Parse Tags", variant="primary", size="lg", visible=True, scale=3)
-                    select_folder_btn = gr.Button("📁 Select Dataset Folder", size="lg", visible=True, scale=1)
-                
-                gr.Markdown("### 🚀 Step 3: Inject Metadata")
-                
-                inject_btn = gr.Button("💾 Inject Metadata & Save", variant="primary", size="lg", interactive=False)
-                
-                output_status = gr.Textbox(label="Output Status", interactive=False, lines=4)
-                output_path = gr.Textbox(label="Output File Location", interactive=False, lines=4)
-                
-            # RIGHT COLUMN - Step 2 Review Tags + Instructions
-            with gr.Column(scale=1):
-                gr.Markdown("### 🏷️ Step 2: Review Tags")
-                
-                tag_display = gr.JSON(
-                    label="Tag Frequencies",
-                    value={}
-                )
-                
-                manual_preview = gr.JSON(
-                    label="Tag Frequencies (Live Preview)",
-                    value={},
-                    visible=False
-                )
-                
-                review_status = gr.Markdown("")
-                
-                gr.Markdown(
-                    "*Review the tag frequencies that will be injected into your LoRA*"
-                )
-                
-                # Dynamic Instructions
-                instructions_display = gr.Markdown("""
-                ### 📋 Instructions:
-                
-                **Normal Mode (with dataset):**
-                1. Place your LoRA file (.safetensors) in the `Model to Repair` folder
-                2. Select your LoRA filename from the dropdown
-                3. Select a dataset subfolder from the dropdown, OR enter a custom full path to your dataset folder
-                4. Click "Scan Dataset / Parse Tags" to detect tags
-                5. Review the tag frequencies
-                6. Click "Inject Metadata & Save" to create your updated LoRA
-                
-                **File Locations:**
-                - **Input:** Place LoRA files in `Model to Repair/`
-                - **Output:** Updated files saved to `Updated LoRA/`
-                
-                **Note:** You can use subfolders inside 'Model to Repair' for datasets or provide any custom folder path on your system.
-                """)
-        
-        # Event handlers
-        def toggle_manual_mode(is_manual):
-            if is_manual:
-                instructions_text = """
-                ### 📋 Instructions:
-                
-                **Manual Mode (without dataset):**
-                1. Place your LoRA file (.safetensors) in the `Model to Repair` folder
-                2. Select your LoRA filename from the dropdown
-                3. Check "Manual trigger word mode"
-                4. Enter your trigger words (comma-separated)
-                5. Set the tag frequency (default: 1)
-                6. Watch the live preview and status update as you type
-                7. When the status is green and tags are ready, click "Inject Metadata & Save"
-                
-                **File Locations:**
-                - **Input:** Place LoRA files in `Model to Repair/`
-                - **Output:** Updated files saved to `Updated LoRA/`
-                """
+            selected = {}
+        
+        dataset_folders = {}
+        for name, group in sorted(selected.items()):
+            if not group["caption_count"]:
+                continue
+            counter = group["counter"]
+            if approximate:
+                tag_frequencies = counter.top(int(approximate_top))
+                note = approximate_note(counter, tag_frequencies)
+                missing, orphans = None, None
             else:
-                instructions_text = """
-                ### 📋 Instructions:
-                
-                **Normal Mode (with dataset):**
-                1. Place your LoRA file (.safetensors) in the `Model to Repair` folder
-                2. Select your LoRA filename from the dropdown
-                3. Select a dataset subfolder from the dropdown, OR enter a custom full path to your dataset folder
-                4. Click "Scan Dataset / Parse Tags" to detect tags
-                5. Review the tag frequencies
-                6. Click "Inject Metadata & Save" to create your updated LoRA
-                
-                **File Locations:**
-                - **Input:** Place LoRA files in `Model to Repair/`
-                - **Output:** Updated files saved to `Updated LoRA/`
-                
-                **Note:** You can use subfolders inside 'Model to Repair' for datasets or provide any custom folder path on your system.
-                """
+                tag_frequencies = counter.to_dict()
+                note = f" with {len(tag_frequencies)} unique tags"
+                missing = len(group["images"] - group["captions"])
+                orphans = len(group["captions"] - group["images"]) if group["images"] else 0
+            dataset_folders[name] = {
+                "tag_frequency": tag_frequencies,
+                "img_count": group["image_count"] or group["caption_count"],
+                "caption_count": group["caption_count"],
+                "missing_captions": missing,
+                "orphan_captions": orphans,
+                "n_repeats": parse_kohya_folder_name(name) or 1,
+                "note": note,
+            }
+        
+        if not dataset_folders:
+            return None, f"[ERROR] No caption files found in {archive_path.name}"
+        
+        if stats is not None:
+            for group in groups.values():
+                stats.count("captions", group["caption_count"])
+                stats.count("images", group["image_count"])
+            stats.count("tags", len(merge_folder_tags(dataset_folders)))
+        
+        if len(dataset_folders) == 1 and not kohya_groups:
+            return dataset_folders, "[OK] " + describe_folder_scan(next(iter(dataset_folders.values())))
+        return dataset_folders, "[OK] " + describe_dataset_folders(dataset_folders)
+    
+    def _scan_folder(self, dataset_path, workers, use_cache, approximate_top, progress, probe_resolution=False,
+                     stats=None, normalizer=None):
+        """Pair images with captions and count the tags of one dataset folder.
+        
+        Returns {"tag_frequency", "img_count", "caption_count", "missing_captions",
+        "orphan_captions", "note"}. img_count is the number of image files, or
+        the number of captions for caption-only folders. With probe_resolution,
+        "image_sizes" holds a {(width, height): count} histogram read from the
+        image headers.
+        """
+        if approximate_top and approximate_top > 0:
+            if progress is not None:
+                progress.start("Scanning captions (approximate)")
+            # Streaming keeps memory bounded, so there is no stem index to pair
+            # images with captions, the exact scan cache is bypassed and image
+            # sizes are not probed
+            counts = {}
+            # Listing, reading and counting are interleaved, so they are timed together
+            with timed(stats, "read"):
+                tag_counter, caption_count = count_caption_files_approximate(
+                    iter_caption_files(dataset_path, counts), int(approximate_top), workers, progress, normalizer
+                )
+            if stats is not None:
+                stats.count("captions", caption_count)
+                stats.count("images", counts.get("images", 0))
             
+            tag_frequencies = tag_counter.top(int(approximate_top))
             return {
-                subfolder_input: gr.update(visible=not is_manual),
-                manual_tags_input: gr.update(visible=is_manual),
-                tag_frequency_input: gr.update(visible=is_manual),
-                scan_btn: gr.update(visible=not is_manual),
-                select_folder_btn: gr.update(visible=not is_manual),
-                tag_display: gr.update(visible=not is_manual, value={}),
-                manual_preview: gr.update(visible=is_manual, value={}),
-                review_status: gr.update(value=""),
-                inject_btn: gr.update(interactive=False),
-                current_tags: {},
-                instructions_display: gr.update(value=instructions_text)
+                "tag_frequency": tag_frequencies,
+                "img_count": counts.get("images") or caption_count,
+                "caption_count": caption_count,
+                "missing_captions": None,
+                "orphan_captions": None,
+                "note": approximate_note(tag_counter, tag_frequencies),
             }
         
-        def select_dataset_folder():
-            """Open folder browser dialog"""
+        with timed(stats, "list"):
+            listing = list_dataset_folder(dataset_path, with_stats=use_cache)
+        
+        cache_note = ""
+        if use_cache:
+            cache_path = cache_path_for(self.cache_dir, dataset_path)
             try:
-                import tkinter as tk
-                from tkinter import filedialog
-                
-                root = tk.Tk()
-                root.withdraw()
-                root.wm_attributes('-topmost', 1)
-                
-                folder_path = filedialog.askdirectory(
-                    title="Select Dataset Folder",
-                    initialdir=str(injector.dataset_dir)
+                tag_counter, caption_count, read, reused = scan_with_cache(
+                    dataset_path, cache_path, read_caption_tags, workers, progress, listing.caption_stats, stats
                 )
-                
-                root.destroy()
-                
-                if folder_path:
-                    return gr.update(value=folder_path)
-                else:
-                    return gr.update()
-            except Exception as e:
-                # Fallback if tkinter not available
-                return gr.update()
-        
-        def scan_dataset_handler(is_manual, subfolder, lora_file):
-            if not lora_file:
-                status = "⚠️ [WARNING] Please select a LoRA file"
-                return {}, status, gr.update(interactive=False), {}
-            
-            if is_manual:
-                status = "<span style='color: orange;'>In manual mode, use the live preview — no scan needed</span>"
-                return {}, status, gr.update(interactive=False), {}
-            
-            if not subfolder:
-                status = "⚠️ [WARNING] Please select a dataset subfolder"
-                return {}, status, gr.update(interactive=False), {}
-            
-            tags, status = injector.scan_dataset(subfolder)
-            success = tags is not None
-            
-            if success:
-                status = f"<span style='color: green;'>{status}</span>"
-                interactive = gr.update(interactive=True)
+            except sqlite3.OperationalError as e:
+                # Another scan of the same folder is holding the cache; the counts don't need it
+                use_cache = False
+                cache_note = f" (scan cache unavailable: {e}, read without it)"
+        if use_cache:
+            if normalizer is not None:
+                # The cache holds raw tags, so the totals are normalized afterwards (once per unique tag)
+                with timed(stats, "normalize"):
+                    tag_frequencies = normalizer.normalize_counts(tag_counter)
             else:
-                status = f"<span style='color: red;'>{status}</span>"
-                interactive = gr.update(interactive=False)
+                tag_frequencies = dict(tag_counter)
+            cache_note = f" (read {read} caption files, {reused} unchanged from cache)"
+        else:
+            txt_files = listing.caption_paths
+            if progress is not None:
+                progress.start("Scanning captions", items_total=len(txt_files))
             
-            return tags or {}, status, interactive, tags or {}
+            if workers and workers > 1 and len(txt_files) > 1:
+                tag_counter, caption_count = count_caption_files_parallel(txt_files, workers, progress, stats,
+                                                                          normalizer)
+            else:
+                tag_counter, caption_count = count_caption_files(txt_files, progress, stats=stats,
+                                                                 normalizer=normalizer)
+            tag_frequencies = tag_counter.to_dict()
         
-        def inject_handler(is_manual, lora_file, subfolder, tags):
-            if not tags:
-                return "[WARNING] No tags to inject — please scan or enter tags first", ""
-            
-            if not lora_file:
-                return "[WARNING] Missing LoRA file", ""
-            
-            folder_name = "manual_tags" if is_manual else subfolder
-            
-            if not is_manual and not subfolder:
-                return "[WARNING] Missing dataset subfolder", ""
-            
-            output_path_result, status = injector.inject_metadata(lora_file, folder_name, tags)
-            return status, output_path_result or ""
-        
-        # Connect event handlers
-        manual_mode.change(
-            fn=toggle_manual_mode,
-            inputs=[manual_mode],
-            outputs=[subfolder_input, manual_tags_input, tag_frequency_input, scan_btn,
-                     select_folder_btn, tag_display, manual_preview, review_status, inject_btn, current_tags, instructions_display]
-        )
+        folder_scan = {
+            "tag_frequency": tag_frequencies,
+            "img_count": listing.image_count or caption_count,
+            "caption_count": caption_count,
+            "missing_captions": len(listing.images_without_captions()),
+            # Caption-only folders have nothing to pair against, so no orphans
+            "orphan_captions": len(listing.orphan_captions()) if listing.image_count else 0,
+            "note": f" with {len(tag_frequencies)} unique tags{cache_note}",
+        }
         
-        manual_tags_input.change(
-            fn=live_validate,
-            inputs=[manual_tags_input, tag_frequency_input],
-            outputs=[manual_preview, review_status, inject_btn, current_tags]
-        )
+        if stats is not None:
+            stats.count("captions", caption_count)
+            stats.count("images", listing.image_count)
+            stats.count("tags", len(tag_frequencies))
         
-        tag_frequency_input.change(
-            fn=live_validate,
-            inputs=[manual_tags_input, tag_frequency_input],
-            outputs=[manual_preview, review_status, inject_btn, current_tags]
-        )
+        if probe_resolution and listing.image_count:
+            with timed(stats, "probe"):
+                image_sizes, unreadable = probe_image_sizes(listing.image_paths, workers, progress)
+            folder_scan["image_sizes"] = image_sizes
+            folder_scan["note"] += f"; probed {sum(image_sizes.values())} image sizes"
+            if unreadable:
+                folder_scan["note"] += f" ({unreadable} unreadable)"
         
-        select_folder_btn.click(
-            fn=select_dataset_folder,
-            outputs=[subfolder_input]
-        )
+        return folder_scan
+    
+    def inject_metadata(self, lora_filename, subfolder_name, tag_frequencies, in_place=False, progress=None,
+                        dataset_folders=None, skip_unchanged=True, write_hashes=True, verify_hashes=False, stats=None,
+                        max_tags_per_folder=None, header_budget=None):
+        """Write the dataset's tag metadata into a LoRA, returning (output path or None, status).
         
-        scan_btn.click(
-            fn=scan_dataset_handler,
-            inputs=[manual_mode, subfolder_input, lora_input],
-            outputs=[tag_display, review_status, inject_btn, current_tags]
-        )
+        max_tags_per_folder keeps only the most frequent tags of each folder,
+        and header_budget (bytes) caps the whole safetensors header by
+        dropping the least frequent tags; what was dropped is recorded in
+        the tag_frequency_truncation field. Each folder keeps at least its
+        top tag, so a budget below the size of the tensor index is exceeded.
+        """
+        with profiled("inject", stats):
+            result = self._inject_metadata(lora_filename, subfolder_name, tag_frequencies, in_place, progress,
+                                           dataset_folders, skip_unchanged, write_hashes, verify_hashes, stats,
+                                           max_tags_per_folder, header_budget)
+        if stats is not None:
+            stats.finish()
+        return result
+    
+    def _inject_metadata(self, lora_filename, subfolder_name, tag_frequencies, in_place, progress,
+                         dataset_folders, skip_unchanged, write_hashes, verify_hashes, stats,
+                         max_tags_per_folder, header_budget):
+        lora_path = self.dataset_dir / lora_filename
         
-        inject_btn.click(
-            fn=inject_handler,
-            inputs=[manual_mode, lora_input, subfolder_input, current_tags],
-            outputs=[output_status, output_path]
+        if not lora_path.exists():
+            return None, f"[ERROR] LoRA file not found: {lora_path}"
+        
+        output_path = self.output_dir / (lora_path.stem + "_with_tags.safetensors")
+        
+        try:
+            with ExitStack() as admitted:
+                with timed(stats, "queue"):
+                    admitted.enter_context(self._admission(lora_path, output_path, progress))
+                with timed(stats, "header"):
+                    recover_header_journal(lora_path)
+                    source_stat = lora_path.stat()
+                    header, data_offset = read_safetensors_header(lora_path)
+                with timed(stats, "build"):
+                    metadata = self._build_metadata(header, subfolder_name, tag_frequencies, dataset_folders,
+                                                    max_tags_per_folder, header_budget, output_alignment(data_offset))
+                    data_length = source_stat.st_size - data_offset
+                    metadata[FINGERPRINT_KEY] = injection_fingerprint(
+                        header, data_length, metadata, (source_stat.st_size, source_stat.st_mtime_ns),
+                        ("copy", "hashes") if write_hashes else ("copy",)
+                    )
+                if stats is not None:
+                    stats.count("header_bytes", data_offset)
+                output, status = self._write_output(lora_path, output_path, header, data_offset, data_length,
+                                                    metadata, in_place, skip_unchanged, write_hashes, verify_hashes,
+                                                    progress, stats)
+                if TRUNCATION_KEY in metadata and not status.startswith(UP_TO_DATE_STATUS):
+                    truncation = json.loads(metadata[TRUNCATION_KEY])
+                    kept = sum(folder["kept"] for folder in truncation.values())
+                    dropped = sum(folder["dropped"] for folder in truncation.values())
+                    status += f"; ss_tag_frequency kept the top {kept} of {kept + dropped} tags"
+                return output, status
+        except OperationCancelled:
+            return None, "[CANCELLED] Injection cancelled, no output written"
+        except Exception as e:
+            return None, f"[ERROR] Error: {str(e)}"
+
+    def _admission(self, lora_path, output_path, progress):
+        if self.scheduler is None:
+            return nullcontext()
+        # The header length is all the memory estimate needs, and reading it
+        # is safe while another job patches the header
+        data_offset = read_safetensors_data_offset(lora_path)
+        # Lock the source too: an in-place patch rewrites it
+        return self.scheduler.slot(
+            [lora_path, output_path],
+            estimate_injection_memory(data_offset, lora_path.stat().st_size - data_offset),
+            progress
         )
     
-    return demo
+    def _build_metadata(self, header, subfolder_name, tag_frequencies, dataset_folders, max_tags_per_folder=None,
+                        header_budget=None, alignment=8):
+        metadata = dict(header.get("__metadata__") or {})
+        # Left over from an earlier injection with different limits
+        metadata.pop(TRUNCATION_KEY, None)
+        
+        if dataset_folders:
+            # Kohya layout: one entry per N_name folder, as kohya's trainer writes them
+            dataset_dirs = {
+                name: {"n_repeats": folder["n_repeats"], "img_count": folder["img_count"]}
+                for name, folder in dataset_folders.items()
+            }
+            tag_freq = {name: folder["tag_frequency"] for name, folder in dataset_folders.items()}
+        else:
+            # Only the folder's own name belongs in the key, not a full custom path
+            folder_key = "1_" + Path(subfolder_name).name
+            # Without a scan there's no image count; every image carries each
+            # tag at most once, so the highest tag count is the best lower bound
+            dataset_dirs = {
+                folder_key: {
+                    "n_repeats": 1,
+                    "img_count": max(tag_frequencies.values(), default=0)
+                }
+            }
+            tag_freq = {
+                folder_key: tag_frequencies
+            }
+        
+        metadata["ss_tag_frequency"] = json.dumps(tag_freq)
+        metadata["ss_dataset_dirs"] = json.dumps(dataset_dirs)
+        
+        # Probed image sizes (scan with probe_resolution) replace the 1024 default
+        image_sizes = Counter()
+        for folder in (dataset_folders or {}).values():
+            image_sizes.update(folder.get("image_sizes") or {})
+        resolution_summary = summarize_resolutions(image_sizes)
+        if resolution_summary is None:
+            metadata["ss_resolution"] = "1024,1024"
+        else:
+            resolution, bucket_info = resolution_summary
+            metadata["ss_resolution"] = f"{resolution[0]},{resolution[1]}"
+            metadata["ss_bucket_info"] = json.dumps(bucket_info)
+        # Kohya counts every repeat of an image as a training image
+        metadata["ss_num_train_images"] = str(sum(d["img_count"] * d["n_repeats"] for d in dataset_dirs.values()))
+        
+        if max_tags_per_folder or header_budget:
+            budget_bytes = None
+            if header_budget:
+                # Everything else in the header, with room for the fields written after this
+                reserved = dict(metadata, ss_tag_frequency="", **{
+                    TRUNCATION_KEY: json.dumps(truncation_placeholder(tag_freq)),
+                    FINGERPRINT_KEY: "0" * 64,
+                    MODEL_HASH_KEY: "0" * 64,
+                    LEGACY_HASH_KEY: "0" * 8,
+                })
+                # The copy pads the header out to a multiple of the alignment, so
+                # the padded header fits exactly when the unpadded one fits the
+                # budget rounded down to that multiple
+                unpadded = len(build_safetensors_header(dict(header, __metadata__=reserved), alignment=1))
+                budget_bytes = header_budget // alignment * alignment - unpadded
+            kept, truncation = truncate_tag_frequency(tag_freq, max_tags_per_folder, budget_bytes)
+            if truncation:
+                metadata["ss_tag_frequency"] = json.dumps(kept)
+                metadata[TRUNCATION_KEY] = json.dumps(truncation)
+        return metadata
+    
+    def _write_output(self, lora_path, output_path, header, data_offset, data_length, metadata, in_place,
+                      skip_unchanged, write_hashes, verify_hashes, progress, stats=None):
+        # Patching changes the source's own mtime, so an in-place fingerprint
+        # covers the layout and metadata only; the payload it sits next to is
+        # the one it was written for
+        patch_metadata = None
+        if in_place:
+            patch_metadata = dict(metadata, **{FINGERPRINT_KEY: injection_fingerprint(header, data_length, metadata,
+                                                                                      options=("in-place",))})
+            if not metadata_fits_in_place(header, data_offset, patch_metadata):
+                # Falls back to a copy, which is then what has to be up to date
+                patch_metadata = None
+        if skip_unchanged:
+            with timed(stats, "check"):
+                if patch_metadata is not None:
+                    target, fingerprint = lora_path, patch_metadata[FINGERPRINT_KEY]
+                else:
+                    target, fingerprint = output_path, metadata[FINGERPRINT_KEY]
+                if is_output_up_to_date(target, fingerprint, data_length):
+                    return str(target), f"{UP_TO_DATE_STATUS}, skipped: {target.name}"
+        
+        on_progress = None
+        if progress is not None:
+            on_progress = lambda nbytes: progress.advance(nbytes=nbytes)
+        
+        if patch_metadata is not None:
+            # The payload and data offset stay where they are, so sshs_* values
+            # already in the header stay valid; hashing here would turn a
+            # few-KB header write into a read of the whole file
+            with timed(stats, "patch"):
+                patched = patch_safetensors_metadata_in_place(lora_path, patch_metadata)
+            if patched:
+                note = ""
+                if write_hashes and known_model_hash(metadata) is None:
+                    note = " (no model hashes: the source has none to keep, write a copy to add them)"
+                return str(lora_path), f"[OK] Patched metadata in place: {lora_path.name}{note}"
+        
+        if progress is not None:
+            progress.start("Copying tensor payload", bytes_total=data_length)
+        
+        # Written next to the output under a hidden name and swapped in once
+        # complete, so readers never see a half-written LoRA
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            # A model hash the source already carries is reused, which keeps the zero-copy strategies open
+            streamed_hashes = write_hashes and known_model_hash(metadata) is None
+            with timed(stats, "copy"):
+                strategy = rewrite_safetensors_metadata(lora_path, tmp_path, metadata, on_progress=on_progress,
+                                                        write_hashes=write_hashes)
+            if stats is not None:
+                stats.count("payload_bytes", data_length)
+            copy_note = f"payload copy: {strategy}"
+            if write_hashes and not streamed_hashes:
+                copy_note += ", model hash kept from source"
+            if verify_hashes:
+                with timed(stats, "verify"):
+                    copy_note += ", " + self._verify_payload_hash(lora_path, tmp_path, data_length, streamed_hashes,
+                                                                  progress)
+            with timed(stats, "rename"):
+                os.replace(tmp_path, output_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        
+        if in_place:
+            return str(output_path), f"[OK] Header has no room for an in-place patch, created: {output_path.name} ({copy_note})"
+        return str(output_path), f"[OK] Successfully created: {output_path.name} ({copy_note})"
+    
+    def _verify_payload_hash(self, lora_path, output_path, data_length, hashes_written, progress=None):
+        """Reread the output payload and check that its hash matches the source's."""
+        on_progress = None
+        if progress is not None:
+            on_progress = lambda nbytes: progress.advance(nbytes=nbytes)
+        
+        if hashes_written:
+            # Computed from the source chunks while they were copied
+            expected = read_safetensors_header(output_path)[0]["__metadata__"][MODEL_HASH_KEY]
+        else:
+            if progress is not None:
+                progress.start("Hashing source payload", bytes_total=data_length)
+            expected = hash_payload(lora_path, on_progress=on_progress).model_hash
+        
+        if progress is not None:
+            progress.start("Verifying output payload", bytes_total=data_length)
+        actual = hash_payload(output_path, on_progress=on_progress).model_hash
+        if actual != expected:
+            raise ValueError(f"Output payload hash {actual[:12]} does not match the source ({expected[:12]}), output discarded")
+        return f"verified {actual[:12]}"
 
-if __name__ == "__main__":
-    demo = create_ui()
-    demo.launch(
-        server_name="127.0.0.1",
-        server_port=7860,
-        share=False,
-        show_error=True,
-        theme=gr.themes.Soft()
+def log_job_timings(log_path, result):
+    """Append the scan/inject timing records of one batch_inject.run_job result to a JSON-lines log."""
+    append_timings_log(log_path, [
+        dict(record, time=time.time(), lora=result["lora"], dataset=result["dataset"], status=result["status"])
+        for record in result["timings"]
+    ])
+
+def run_batch_command(args):
+    from batch_inject import find_batch_jobs, load_manifest, run_batch, format_result, format_summary
+    
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+    elif args.directory:
+        jobs = find_batch_jobs(args.directory)
+    else:
+        print("[ERROR] Pass a directory or --manifest")
+        return 2
+    
+    if not jobs:
+        print("[ERROR] No LoRA files found")
+        return 1
+    
+    try:
+        normalizer = make_tag_normalizer(args.normalize_tags, args.tag_rules)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Could not load tag rules: {e}")
+        return 2
+    
+    def on_result(result):
+        print(format_result(result), flush=True)
+        if args.timings_log:
+            log_job_timings(args.timings_log, result)
+    
+    start = time.perf_counter()
+    results = run_batch(
+        jobs,
+        workers=args.workers,
+        use_processes=args.processes,
+        scan_workers=args.scan_workers,
+        use_cache=not args.no_scan_cache,
+        approximate_top=args.approx_top,
+        probe_resolution=args.probe_resolution,
+        caption_column=args.caption_column,
+        caption_separator=args.caption_separator,
+        normalizer=normalizer,
+        max_tags_per_folder=args.max_tags_per_folder,
+        header_budget=args.header_budget_kb * 1024 if args.header_budget_kb else None,
+        output_dir=args.output_dir,
+        in_place=args.in_place,
+        skip_unchanged=not args.force,
+        write_hashes=not args.no_hashes,
+        verify_hashes=args.verify,
+        on_result=on_result,
+    )
+    print(format_summary(results, time.perf_counter() - start))
+    return 0 if all(r["output"] for r in results) else 1
+
+def run_watch_command(args):
+    from batch_inject import format_result
+    from watch_folder import FolderWatcher, InotifyWatcher, open_watcher
+    
+    folder = Path(args.directory) if args.directory else MetadataInjector().dataset_dir
+    if not folder.is_dir():
+        print(f"[ERROR] Folder not found: {folder}")
+        return 2
+    
+    try:
+        normalizer = make_tag_normalizer(args.normalize_tags, args.tag_rules)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Could not load tag rules: {e}")
+        return 2
+    
+    def on_result(result):
+        print(time.strftime("%H:%M:%S ") + format_result(result), flush=True)
+        if args.timings_log:
+            log_job_timings(args.timings_log, result)
+    
+    watch = FolderWatcher(
+        folder,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        debounce=args.debounce,
+        on_result=on_result,
+        scan_workers=args.scan_workers,
+        approximate_top=args.approx_top,
+        probe_resolution=args.probe_resolution,
+        skip_unchanged=not args.force,
+        write_hashes=not args.no_hashes,
+        caption_column=args.caption_column,
+        caption_separator=args.caption_separator,
+        normalizer=normalizer,
+        max_tags_per_folder=args.max_tags_per_folder,
+        header_budget=args.header_budget_kb * 1024 if args.header_budget_kb else None,
     )
+    watcher = open_watcher(watch.folder, polling=args.poll)
+    mode = "inotify" if isinstance(watcher, InotifyWatcher) else "polling"
+    print(f"Watching {watch.folder} for new LoRAs ({mode}, {watch.workers} worker(s)), Ctrl+C to stop", flush=True)
+    # Service managers stop daemons with SIGTERM; finish running injections like on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: watch.stop())
+    try:
+        watch.run(existing=args.existing, watcher=watcher)
+    except KeyboardInterrupt:
+        pass
+    print("Stopped")
+    return 0
+
+def format_metadata_value(value, limit=200):
+    text = value if isinstance(value, str) else json.dumps(value)
+    return text if len(text) <= limit else text[:limit] + f"... ({len(text)} chars)"
+
+def run_inspect_command(args):
+    from lora_index import inspect_lora
+    
+    status = 0
+    for path in args.files:
+        info = inspect_lora(path)
+        if info["error"] is not None:
+            print(f"[ERROR] {path}: {info['error']}")
+            status = 1
+            continue
+        
+        if args.json:
+            print(json.dumps({"path": info["path"], "metadata": info["metadata"]}, indent=2))
+            continue
+        
+        print(f"{path}: {len(info['metadata'])} metadata keys")
+        for key, value in sorted(info["metadata"].items()):
+            if key != "ss_tag_frequency":
+                print(f"  {key}: {format_metadata_value(value)}")
+        tag_frequency = info["tag_frequency"]
+        if tag_frequency:
+            top = sorted(tag_frequency.items(), key=lambda item: item[1], reverse=True)[:args.top]
+            print(f"  ss_tag_frequency: {len(tag_frequency)} unique tags, top: "
+                  + ", ".join(f"{tag} ({count})" for tag, count in top))
+        else:
+            print("  ss_tag_frequency: missing")
+    return status
+
+def run_index_command(args):
+    from lora_index import (
+        update_lora_index, find_loras_with_tag,
+        find_loras_without_tag_frequency, find_unreadable_loras, top_library_tags
+    )
+    
+    if not Path(args.directory).is_dir():
+        print(f"[ERROR] Folder not found: {args.directory}")
+        return 2
+    
+    index_path = args.index_file or cache_path_for(Path(__file__).parent / ".scan_cache", args.directory,
+                                                   prefix="lora_index_")
+    start = time.perf_counter()
+    indexed, read, reused, removed = update_lora_index(args.directory, index_path, workers=args.workers)
+    print(f"[OK] Indexed {indexed} LoRA(s) (read {read} headers, {reused} unchanged, {removed} removed) "
+          f"in {time.perf_counter() - start:.2f}s")
+    
+    for path, error in find_unreadable_loras(index_path):
+        print(f"[ERROR] Unreadable: {path}: {error}")
+    
+    if args.missing:
+        missing = find_loras_without_tag_frequency(index_path)
+        print(f"{len(missing)} LoRA(s) without ss_tag_frequency:")
+        for path in missing:
+            print(f"  {path}")
+    
+    for tag in args.tag or []:
+        matches = find_loras_with_tag(index_path, tag)
+        print(f"{len(matches)} LoRA(s) trained on '{tag}':")
+        for path, count in matches:
+            print(f"  {path} ({count})")
+    
+    if not args.missing and not args.tag:
+        print("Most used tags across the library:")
+        for tag, loras, total in top_library_tags(index_path, args.top):
+            print(f"  {tag}: {loras} LoRA(s), {total} occurrences")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dataset Metadata Injection Tool (launches the web UI when no command is given)")
+    parser.add_argument("--inject-workers", type=int, default=2, help="Web UI: injections allowed to run at once")
+    parser.add_argument("--memory-budget-mb", type=int, default=512, help="Web UI: estimated memory budget shared by running injections")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    # Scan and inject options shared by batch and watch
+    job_options = argparse.ArgumentParser(add_help=False)
+    job_options.add_argument("--scan-workers", type=int, default=1, help="Parallel caption readers per dataset scan")
+    job_options.add_argument("--approx-top", type=int, default=0, help="Approximate bounded-memory counting that keeps the top N tags (0 = exact)")
+    job_options.add_argument("--probe-resolution", action="store_true", help="Read image headers to compute ss_resolution and bucket stats")
+    job_options.add_argument("--caption-column", help="Caption column of JSONL/CSV/Parquet caption manifests (default: caption, text, tags or prompt)")
+    job_options.add_argument("--caption-separator", default=",", help="Tag separator inside manifest captions")
+    job_options.add_argument("--normalize-tags", action="store_true", help="Lowercase tags and treat underscores as spaces before counting")
+    job_options.add_argument("--tag-rules", help="Tag normalization rules (.json) or alias map (.csv/.tsv); implies --normalize-tags")
+    job_options.add_argument("--max-tags-per-folder", type=int, help="Keep only the N most frequent tags of each folder in ss_tag_frequency")
+    job_options.add_argument("--header-budget-kb", type=int, help="Drop the least frequent tags until the whole header fits in this many KB")
+    job_options.add_argument("--output-dir", help="Where to write updated LoRAs (default: Updated LoRA/)")
+    job_options.add_argument("--no-hashes", action="store_true", help="Don't compute sshs_model_hash / sshs_legacy_hash (keeps zero-copy payload copies)")
+    job_options.add_argument("--timings-log", help="Append per-stage scan/inject timings for every LoRA to this JSON-lines file")
+    job_options.add_argument("--force", action="store_true", help="Rewrite outputs even when they are already up to date")
+    
+    batch_parser = subparsers.add_parser("batch", parents=[job_options], help="Scan and inject a whole directory of LoRAs")
+    batch_parser.add_argument("directory", nargs="?", help="Folder where each foo.safetensors sits next to a foo/ caption folder")
+    batch_parser.add_argument("--manifest", help='JSON list of {"lora": ..., "dataset": ...} entries')
+    batch_parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of parallel workers")
+    batch_parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    batch_parser.add_argument("--no-scan-cache", action="store_true", help="Reread every caption instead of using the incremental scan cache")
+    batch_parser.add_argument("--in-place", action="store_true", help="Patch headers in place when they have room")
+    batch_parser.add_argument("--verify", action="store_true", help="Reread each output and check its payload hash against the source")
+    
+    watch_parser = subparsers.add_parser("watch", parents=[job_options], help="Keep injecting LoRAs as they are saved into a folder")
+    watch_parser.add_argument("directory", nargs="?", help="Folder to watch (default: Model to Repair/); datasets are matched like in batch mode")
+    watch_parser.add_argument("--workers", type=int, default=2, help="LoRAs scanned and injected at once")
+    watch_parser.add_argument("--debounce", type=float, default=1.0, help="Seconds a new file must stay unchanged before it is injected")
+    watch_parser.add_argument("--poll", action="store_true", help="List the folder periodically instead of using inotify")
+    watch_parser.add_argument("--existing", action="store_true", help="Also inject the LoRAs already in the folder at startup")
+    
+    inspect_parser = subparsers.add_parser("inspect", help="Print the metadata of LoRA files (reads only the header)")
+    inspect_parser.add_argument("files", nargs="+", help="LoRA .safetensors files")
+    inspect_parser.add_argument("--json", action="store_true", help="Dump the raw metadata as JSON")
+    inspect_parser.add_argument("--top", type=int, default=10, help="Number of top tags to show")
+    
+    index_parser = subparsers.add_parser("index", help="Index the tags of every LoRA under a folder and query them")
+    index_parser.add_argument("directory", help="LoRA library folder (searched recursively)")
+    index_parser.add_argument("--tag", action="append", help="List the LoRAs trained on this tag (repeatable)")
+    index_parser.add_argument("--missing", action="store_true", help="List the LoRAs without ss_tag_frequency")
+    index_parser.add_argument("--top", type=int, default=20, help="Number of library-wide top tags to show")
+    index_parser.add_argument("--workers", type=int, default=8, help="Parallel header readers")
+    index_parser.add_argument("--index-file", help="Index database path (default: one per folder in .scan_cache/)")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "batch":
+        return run_batch_command(args)
+    if args.command == "watch":
+        return run_watch_command(args)
+    if args.command == "inspect":
+        return run_inspect_command(args)
+    if args.command == "index":
+        return run_index_command(args)
+    
+    # Gradio is only imported when the UI is actually launched
+    from gradio_ui import main as launch_ui
+    launch_ui(args.inject_workers, args.memory_budget_mb * 1024 * 1024)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
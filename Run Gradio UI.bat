@@ -7,7 +7,7 @@ echo =============================================================
 echo.
 echo This batch file will:
 echo - Create a virtual environment (venv) if it doesn't exist
-echo - Install required dependencies (gradio, safetensors, torch CPU)
+echo - Install required dependencies (gradio)
 echo - Launch the Gradio web interface
 echo.
 echo Folder: %~dp0
@@ -79,7 +79,7 @@ echo.
 
 :: Check if dependencies are installed
 echo Checking dependencies...
-python -c "import gradio, safetensors, torch, packaging, pytz" 2>nul
+python -c "import gradio, packaging, pytz" 2>nul
 if errorlevel 1 (
     echo Dependencies missing. Installing now...
     echo.
@@ -87,10 +87,8 @@ if errorlevel 1 (
     :: Upgrade pip and install dependencies
     python -m pip install --upgrade pip
     python -m pip install packaging
-    python -m pip install safetensors
     python -m pip install gradio
 	python -m pip install pytz
-    python -m pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cpu
     
     if errorlevel 1 (
         echo ERROR: Dependency installation failed.
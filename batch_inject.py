@@ -0,0 +1,134 @@
+import json
+import re
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from Metadata_Injection import MetadataInjector, UP_TO_DATE_STATUS
+from dataset_archive import is_dataset_archive, ARCHIVE_SUFFIXES
+from caption_manifest import is_caption_manifest, CAPTION_MANIFEST_READERS
+from instrumentation import RunStats
+
+# Epoch/step suffixes trainers append to intermediate checkpoints, e.g. my_char-000010 or my_char_e4
+CHECKPOINT_SUFFIX_PATTERN = re.compile(r"[-_](?:epoch|step|ep|e|s)?\d+$")
+
+def find_dataset_for(lora_path):
+    """Return the dataset next to foo.safetensors: a foo/ caption folder, foo.zip/foo.tar.* archive
+    or foo.jsonl/.csv/.parquet caption manifest.
+    
+    Checkpoints such as foo-000010.safetensors fall back to foo's dataset.
+    When nothing matches, the (missing) foo/ folder is returned.
+    """
+    lora_path = Path(lora_path)
+    directory = lora_path.parent
+    stems = [lora_path.stem]
+    base_stem = CHECKPOINT_SUFFIX_PATTERN.sub("", lora_path.stem)
+    if base_stem and base_stem != lora_path.stem:
+        stems.append(base_stem)
+    for stem in stems:
+        if (directory / stem).is_dir():
+            return directory / stem
+        for suffix in ARCHIVE_SUFFIXES + tuple(CAPTION_MANIFEST_READERS):
+            if (directory / (stem + suffix)).is_file():
+                return directory / (stem + suffix)
+    return directory / lora_path.stem
+
+def find_batch_jobs(directory):
+    """Pair every foo.safetensors in directory with its dataset (see find_dataset_for)."""
+    directory = Path(directory).resolve()
+    return [{"lora": str(lora_path), "dataset": str(find_dataset_for(lora_path))}
+            for lora_path in sorted(directory.glob("*.safetensors"))]
+
+def load_manifest(manifest_path):
+    """Load a JSON list of {"lora": ..., "dataset": ...} entries.
+
+    Relative paths are resolved against the folder containing the manifest.
+    """
+    manifest_path = Path(manifest_path).resolve()
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    jobs = []
+    for entry in entries:
+        jobs.append({
+            "lora": str(manifest_path.parent / entry["lora"]),
+            "dataset": str(manifest_path.parent / entry["dataset"]),
+        })
+    return jobs
+
+def run_job(job, output_dir=None, in_place=False, scan_workers=1, use_cache=True, approximate_top=0,
+            probe_resolution=False, skip_unchanged=True, write_hashes=True, verify_hashes=False,
+            caption_column=None, caption_separator=",", normalizer=None, max_tags_per_folder=None,
+            header_budget=None):
+    # Module-level so it can be shipped to a process pool (a TagNormalizer pickles as its rules)
+    start = time.perf_counter()
+    lora_path = Path(job["lora"])
+    dataset_path = Path(job["dataset"])
+    scan_stats = RunStats("scan")
+    timings = []
+
+    output_path, status = None, None
+    try:
+        injector = MetadataInjector(output_dir=output_dir)
+        if not dataset_path.is_dir() and not is_dataset_archive(dataset_path) and not is_caption_manifest(dataset_path):
+            status = f"[ERROR] Dataset folder not found: {dataset_path}"
+        else:
+            folders, status = injector.scan_dataset_folders(
+                str(dataset_path), workers=scan_workers, use_cache=use_cache, approximate_top=approximate_top,
+                probe_resolution=probe_resolution, caption_column=caption_column, caption_separator=caption_separator,
+                stats=scan_stats, normalizer=normalizer
+            )
+            timings.append(scan_stats.to_record())
+            if folders is not None:
+                inject_stats = RunStats("inject")
+                output_path, status = injector.inject_metadata(
+                    str(lora_path), dataset_path.name, None, in_place=in_place, dataset_folders=folders,
+                    skip_unchanged=skip_unchanged, write_hashes=write_hashes, verify_hashes=verify_hashes,
+                    stats=inject_stats, max_tags_per_folder=max_tags_per_folder, header_budget=header_budget
+                )
+                timings.append(inject_stats.to_record())
+    except Exception as e:
+        # One broken job (unreadable cache, unwritable output folder, ...) must not abort the whole batch
+        output_path, status = None, f"[ERROR] Error: {e}"
+
+    size = lora_path.stat().st_size if lora_path.exists() else 0
+    return {
+        "lora": str(lora_path),
+        "dataset": str(dataset_path),
+        "output": output_path,
+        "status": status,
+        "skipped": bool(status and status.startswith(UP_TO_DATE_STATUS)),
+        "bytes": size,
+        "seconds": time.perf_counter() - start,
+        "timings": timings,
+    }
+
+def run_batch(jobs, workers=4, use_processes=False, output_dir=None, in_place=False, scan_workers=1,
+              use_cache=True, approximate_top=0, probe_resolution=False, skip_unchanged=True, write_hashes=True,
+              verify_hashes=False, caption_column=None, caption_separator=",", normalizer=None,
+              max_tags_per_folder=None, header_budget=None, on_result=None):
+    """Run scan + inject for every job on a worker pool and return the per-file results."""
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    results = []
+    with executor_cls(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(run_job, job, output_dir, in_place, scan_workers, use_cache, approximate_top,
+                                   probe_resolution, skip_unchanged, write_hashes, verify_hashes, caption_column,
+                                   caption_separator, normalizer, max_tags_per_folder, header_budget)
+                   for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+def format_result(result):
+    return f"{Path(result['lora']).name}: {result['status']} ({result['seconds']:.2f}s)"
+
+def format_summary(results, elapsed):
+    ok = sum(1 for r in results if r["output"])
+    skipped = sum(1 for r in results if r.get("skipped"))
+    total_mb = sum(r["bytes"] for r in results if r["output"] and not r.get("skipped")) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+    return (f"Processed {len(results)} LoRA(s): {ok} succeeded ({skipped} already up to date), {len(results) - ok} failed, "
+            f"{total_mb:.1f} MB in {elapsed:.2f}s ({total_mb / elapsed:.1f} MB/s, {len(results) / elapsed:.1f} files/s)")
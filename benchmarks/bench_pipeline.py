@@ -0,0 +1,245 @@
+"""End-to-end benchmark: dataset scan, metadata injection and batch runs on synthetic data.
+
+Usage: python benchmarks/bench_pipeline.py [--lora-mb 8,256,4096] [--captions N] [--vocab N]
+                                           [--save-baseline FILE] [--baseline FILE] [--tolerance 0.15]
+
+Every case runs in a fresh process, so its peak RSS is its own. With
+--baseline, cases slower (or hungrier) than the baseline by more than the
+tolerance are reported as regressions and the exit status is 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from synthetic import write_synthetic_lora, write_caption_dataset
+
+# Settings that change what is measured; results are only comparable when they match
+WORKLOAD_KEYS = ("lora_mb", "captions", "vocab", "tags_per_caption", "images", "scan_workers",
+                 "batch_loras", "batch_lora_mb", "batch_workers")
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def prepare_lora(workdir, size_mb, name=None):
+    path = Path(workdir) / (name or f"lora_{size_mb}mb")
+    path = path.with_suffix(".safetensors")
+    if not path.exists():
+        write_synthetic_lora(path, size_mb * 1024 * 1024)
+    return path
+
+def prepare_dataset(workdir, args):
+    folder = Path(workdir) / f"captions_{args.captions}_{args.vocab}_{args.tags_per_caption}{'_img' if args.images else ''}"
+    done = folder.with_suffix(".done")
+    if not done.exists():
+        total = write_caption_dataset(folder, args.captions, args.vocab, args.tags_per_caption, images=args.images)
+        done.write_text(str(total))
+    return folder, int(done.read_text())
+
+def _injector(workdir):
+    from Metadata_Injection import MetadataInjector
+    return MetadataInjector(dataset_dir=workdir, output_dir=Path(workdir) / "out", cache_dir=Path(workdir) / "cache")
+
+# Each case runs inside its own child process and returns (items, bytes, seconds)
+
+def case_scan(workdir, dataset, caption_bytes, args):
+    injector = _injector(workdir)
+    start = time.perf_counter()
+    folders, status = injector.scan_dataset_folders(str(dataset), workers=args.scan_workers, use_cache=False,
+                                                    probe_resolution=args.images)
+    elapsed = time.perf_counter() - start
+    if folders is None:
+        raise RuntimeError(status)
+    return args.captions, caption_bytes, elapsed
+
+def case_scan_cached(workdir, dataset, caption_bytes, args):
+    injector = _injector(workdir)
+    injector.scan_dataset_folders(str(dataset), workers=args.scan_workers, use_cache=True)
+    start = time.perf_counter()
+    folders, status = injector.scan_dataset_folders(str(dataset), workers=args.scan_workers, use_cache=True)
+    elapsed = time.perf_counter() - start
+    if folders is None:
+        raise RuntimeError(status)
+    return args.captions, caption_bytes, elapsed
+
+def case_inject(workdir, lora, dataset, write_hashes):
+    injector = _injector(workdir)
+    folders, status = injector.scan_dataset_folders(str(dataset), use_cache=True)
+    if folders is None:
+        raise RuntimeError(status)
+    start = time.perf_counter()
+    output, status = injector.inject_metadata(lora.name, dataset.name, None, dataset_folders=folders,
+                                              skip_unchanged=False, write_hashes=write_hashes)
+    elapsed = time.perf_counter() - start
+    if output is None:
+        raise RuntimeError(status)
+    os.remove(output)
+    return 1, lora.stat().st_size, elapsed
+
+def case_rerun(workdir, lora, dataset):
+    # Also a regression check: a rerun with unchanged options must be skipped,
+    # and one with changed write options must rewrite the output
+    from Metadata_Injection import UP_TO_DATE_STATUS
+    from safetensors_io import MODEL_HASH_KEY, read_safetensors_header
+    injector = _injector(workdir)
+    folders, status = injector.scan_dataset_folders(str(dataset), use_cache=True)
+    if folders is None:
+        raise RuntimeError(status)
+    inject = lambda write_hashes: injector.inject_metadata(lora.name, dataset.name, None, dataset_folders=folders,
+                                                           write_hashes=write_hashes)
+    output, status = inject(False)
+    if output is None:
+        raise RuntimeError(status)
+    start = time.perf_counter()
+    output, status = inject(False)
+    elapsed = time.perf_counter() - start
+    if not status.startswith(UP_TO_DATE_STATUS):
+        raise RuntimeError(f"unchanged rerun was not skipped: {status}")
+    output, status = inject(True)
+    if status.startswith(UP_TO_DATE_STATUS) or MODEL_HASH_KEY not in read_safetensors_header(output)[0]["__metadata__"]:
+        raise RuntimeError(f"rerun with model hashes did not rewrite the output: {status}")
+    os.remove(output)
+    return 1, lora.stat().st_size, elapsed
+
+def case_batch(workdir, loras, dataset, args):
+    from batch_inject import run_batch
+    jobs = [{"lora": str(lora), "dataset": str(dataset)} for lora in loras]
+    output_dir = Path(workdir) / "batch_out"
+    start = time.perf_counter()
+    results = run_batch(jobs, workers=args.batch_workers, output_dir=output_dir, use_cache=False,
+                        skip_unchanged=False)
+    elapsed = time.perf_counter() - start
+    failed = [r["status"] for r in results if not r["output"]]
+    if failed:
+        raise RuntimeError(failed[0])
+    for result in results:
+        os.remove(result["output"])
+    return len(results), sum(r["bytes"] for r in results), elapsed
+
+def _run_in_child(case, case_args):
+    items, nbytes, seconds = case(*case_args)
+    return {"items": items, "bytes": nbytes, "seconds": seconds, "peak_rss_mb": peak_rss_mb()}
+
+def run_case(case, case_args, repeat):
+    """Best of repeat runs, each in a fresh process."""
+    best = None
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(_run_in_child, case, case_args).result()
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    seconds = max(best["seconds"], 1e-9)
+    best["mb_per_s"] = best["bytes"] / (1024 * 1024) / seconds
+    best["items_per_s"] = best["items"] / seconds
+    return best
+
+def format_case(name, result):
+    rss = f"{result['peak_rss_mb']:8.1f} MB" if result["peak_rss_mb"] is not None else "       n/a"
+    return (f"{name:<22} {result['seconds']:8.3f}s  {result['mb_per_s']:9.1f} MB/s  "
+            f"{result['items_per_s']:11.1f} items/s  peak RSS {rss}")
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return the lines describing each case against the baseline, and whether any case regressed."""
+    lines = []
+    regressed = False
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name:<22} (not in baseline)")
+            continue
+        ratio = result["seconds"] / max(base["seconds"], 1e-9)
+        notes = []
+        if ratio > 1 + tolerance:
+            notes.append("SLOWER")
+        if result["peak_rss_mb"] and base.get("peak_rss_mb") and \
+                result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            notes.append(f"RSS {base['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB")
+        regressed = regressed or bool(notes)
+        lines.append(f"{name:<22} {base['seconds']:8.3f}s -> {result['seconds']:8.3f}s  ({1 / ratio:.2f}x)"
+                     + (f"  REGRESSION: {', '.join(notes)}" if notes else ""))
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lora-mb", default="8,256", help="Comma-separated synthetic LoRA sizes in MB for the inject cases")
+    parser.add_argument("--captions", type=int, default=20_000)
+    parser.add_argument("--vocab", type=int, default=20_000)
+    parser.add_argument("--tags-per-caption", type=int, default=25)
+    parser.add_argument("--images", action="store_true", help="Add placeholder PNGs and probe their resolutions in the scan case")
+    parser.add_argument("--scan-workers", type=int, default=1)
+    parser.add_argument("--batch-loras", type=int, default=8)
+    parser.add_argument("--batch-lora-mb", type=int, default=32)
+    parser.add_argument("--batch-workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept")
+    parser.add_argument("--workdir", default=str(Path(tempfile.gettempdir()) / "lora_metadata_bench"),
+                        help="Where synthetic files are generated (and reused by later runs)")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown / RSS growth before a case counts as a regression")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    lora_sizes = [int(size) for size in args.lora_mb.split(",") if size.strip()]
+
+    print(f"Generating synthetic data in {workdir}")
+    dataset, caption_bytes = prepare_dataset(workdir, args)
+    loras = {size: prepare_lora(workdir, size) for size in lora_sizes}
+    batch_loras = [prepare_lora(workdir, args.batch_lora_mb, f"batch_{i}_{args.batch_lora_mb}mb")
+                   for i in range(args.batch_loras)]
+
+    cases = [
+        ("scan", case_scan, (workdir, dataset, caption_bytes, args)),
+        ("scan_cached", case_scan_cached, (workdir, dataset, caption_bytes, args)),
+    ]
+    for size, lora in loras.items():
+        cases.append((f"inject_{size}mb", case_inject, (workdir, lora, dataset, True)))
+        cases.append((f"inject_{size}mb_nohash", case_inject, (workdir, lora, dataset, False)))
+        cases.append((f"rerun_{size}mb", case_rerun, (workdir, lora, dataset)))
+    cases.append((f"batch_{args.batch_loras}x{args.batch_lora_mb}mb", case_batch, (workdir, batch_loras, dataset, args)))
+
+    results = {}
+    for name, case, case_args in cases:
+        results[name] = run_case(case, case_args, max(1, args.repeat))
+        print(format_case(name, results[name]))
+
+    config = {key: getattr(args, key) for key in WORKLOAD_KEYS}
+    config.update(python=platform.python_version(), machine=platform.machine(), cpus=os.cpu_count())
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        mismatched = [key for key in WORKLOAD_KEYS if baseline["config"].get(key) != config[key]]
+        print(f"\nAgainst {args.baseline}:")
+        if mismatched:
+            print(f"Warning: baseline was recorded with different settings ({', '.join(mismatched)})")
+        lines, regressed = compare_to_baseline(results, baseline["results"], args.tolerance)
+        print("\n".join(lines))
+        exit_code = 1 if regressed else 0
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"\nSaved results to {args.save_baseline}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Synthetic LoRA files and caption datasets for the benchmarks.
+
+Everything is generated from a seed, so two runs with the same parameters
+produce identical files and can be compared with each other.
+"""
+import itertools
+import json
+import random
+import struct
+import zlib
+from pathlib import Path
+
+# Tensor data is written by repeating one random block, which keeps
+# generating multi-GB files disk-bound instead of RNG-bound
+FILL_BLOCK_SIZE = 1024 * 1024
+# Image sizes drawn for the placeholder PNGs, so resolution probing has buckets to sort
+IMAGE_SIZES = ((1024, 1024), (832, 1216), (1216, 832), (896, 1152), (768, 1344), (2048, 2048))
+
+def make_vocab(vocab_size):
+    return [f"tag_{i}" for i in range(vocab_size)]
+
+def make_captions(count, vocab_size, tags_per_caption, seed=0):
+    rng = random.Random(seed)
+    vocab = make_vocab(vocab_size)
+    # Zipf-like weights give the long tail real caption sets have
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocab_size)))
+    return [", ".join(rng.choices(vocab, cum_weights=cum_weights, k=tags_per_caption)) for _ in range(count)]
+
+def _sdxl_modules():
+    """(Kohya module name, in features, out features) for the layers an SDXL LoRA usually trains."""
+    modules = []
+    for layer in range(12):
+        prefix = f"lora_te1_text_model_encoder_layers_{layer}"
+        modules += [(f"{prefix}_self_attn_{proj}_proj", 768, 768) for proj in ("q", "k", "v", "out")]
+        modules += [(f"{prefix}_mlp_fc1", 768, 3072), (f"{prefix}_mlp_fc2", 3072, 768)]
+
+    blocks = [("input_blocks_4_1", 640, 2), ("input_blocks_5_1", 640, 2),
+              ("input_blocks_7_1", 1280, 10), ("input_blocks_8_1", 1280, 10),
+              ("middle_block_1", 1280, 10),
+              ("output_blocks_0_1", 1280, 10), ("output_blocks_1_1", 1280, 10), ("output_blocks_2_1", 1280, 10),
+              ("output_blocks_3_1", 640, 2), ("output_blocks_4_1", 640, 2), ("output_blocks_5_1", 640, 2)]
+    for block, dim, depth in blocks:
+        prefix = f"lora_unet_{block}"
+        modules += [(f"{prefix}_proj_in", dim, dim), (f"{prefix}_proj_out", dim, dim)]
+        for i in range(depth):
+            tb = f"{prefix}_transformer_blocks_{i}"
+            modules += [(f"{tb}_attn1_to_{proj}", dim, dim) for proj in ("q", "k", "v", "out_0")]
+            modules += [(f"{tb}_attn2_to_q", dim, dim), (f"{tb}_attn2_to_k", 2048, dim),
+                        (f"{tb}_attn2_to_v", 2048, dim), (f"{tb}_attn2_to_out_0", dim, dim)]
+            modules += [(f"{tb}_ff_net_0_proj", dim, dim * 8), (f"{tb}_ff_net_2", dim * 4, dim)]
+    return modules
+
+def _lora_layout(target_bytes):
+    """Pick the rank (and, for tiny targets, the module subset) that gets closest to target_bytes of fp16 data."""
+    modules = _sdxl_modules()
+    bytes_per_rank = sum(2 * (n_in + n_out) for _, n_in, n_out in modules)
+    rank = max(1, round(target_bytes / bytes_per_rank))
+    if rank == 1:
+        kept, total = [], 0
+        for module in modules:
+            total += 2 * (module[1] + module[2])
+            if kept and total > target_bytes:
+                break
+            kept.append(module)
+        modules = kept
+    return modules, rank
+
+def write_synthetic_lora(path, target_bytes, seed=0):
+    """Write an SDXL-style fp16 LoRA of roughly target_bytes and return its real size.
+
+    The header has Kohya's key layout (lora_down / lora_up / alpha per module)
+    and a handful of ss_* training keys, without ss_tag_frequency.
+    """
+    modules, rank = _lora_layout(target_bytes)
+    header = {"__metadata__": {
+        "ss_base_model_version": "sdxl_base_v1-0",
+        "ss_network_module": "networks.lora",
+        "ss_network_dim": str(rank),
+        "ss_network_alpha": str(max(1, rank // 2)),
+        "ss_output_name": Path(path).stem,
+    }}
+    offset = 0
+    for name, n_in, n_out in modules:
+        for key, shape in ((f"{name}.alpha", []), (f"{name}.lora_down.weight", [rank, n_in]),
+                           (f"{name}.lora_up.weight", [n_out, rank])):
+            length = 2
+            for dim in shape:
+                length *= dim
+            header[key] = {"dtype": "F16", "shape": shape, "data_offsets": [offset, offset + length]}
+            offset += length
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # safetensors pads the header with spaces to an 8-byte boundary
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    block = random.Random(seed).randbytes(FILL_BLOCK_SIZE)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        remaining = offset
+        while remaining > 0:
+            chunk = block[:min(remaining, FILL_BLOCK_SIZE)]
+            f.write(chunk)
+            remaining -= len(chunk)
+    return 8 + len(header_bytes) + offset
+
+def _png_header(width, height):
+    # Just the signature, IHDR and IEND: enough for header-only probing
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IEND', b'')
+
+def write_caption_dataset(folder, count, vocab_size, tags_per_caption, seed=0, images=False):
+    """Write count Zipf-distributed .txt captions (and placeholder PNGs when images is set) into folder.
+
+    Returns the total caption size in bytes.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed + 1)
+    total = 0
+    for i, caption in enumerate(make_captions(count, vocab_size, tags_per_caption, seed)):
+        data = caption.encode('utf-8')
+        (folder / f"{i:07d}.txt").write_bytes(data)
+        total += len(data)
+        if images:
+            (folder / f"{i:07d}.png").write_bytes(_png_header(*rng.choice(IMAGE_SIZES)))
+    return total
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+from pathlib import Path
+
+# Tried in order when no caption column is given
+CAPTION_COLUMN_CANDIDATES = ("caption", "text", "tags", "prompt")
+# File names a dataset folder may keep its captions in (Hugging Face imagefolder style)
+FOLDER_MANIFEST_NAMES = ("metadata.jsonl", "metadata.csv", "metadata.parquet")
+PARQUET_BATCH_SIZE = 8192
+
+def _pick_column(columns, caption_column, source):
+    if caption_column:
+        if caption_column not in columns:
+            raise ValueError(f"Column '{caption_column}' not found in {source} (columns: {', '.join(columns)})")
+        return caption_column
+    for candidate in CAPTION_COLUMN_CANDIDATES:
+        if candidate in columns:
+            return candidate
+    raise ValueError(f"No caption column found in {source}, pick one of: {', '.join(columns)}")
+
+def _iter_jsonl(path, caption_column):
+    column = caption_column
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if column is None:
+                column = _pick_column(list(row), None, Path(path).name)
+            yield row.get(column), len(line)
+
+def _iter_csv(path, caption_column, delimiter=","):
+    consumed = [0]
+
+    def counted_lines(f):
+        for line in f:
+            consumed[0] += len(line)
+            yield line
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(counted_lines(f), delimiter=delimiter)
+        column = _pick_column(reader.fieldnames or [], caption_column, Path(path).name)
+        for row in reader:
+            # Quoted captions may span several lines, so report what the row took
+            nbytes, consumed[0] = consumed[0], 0
+            yield row.get(column), nbytes
+
+def _iter_tsv(path, caption_column):
+    return _iter_csv(path, caption_column, delimiter="\t")
+
+def _iter_parquet(path, caption_column):
+    # pyarrow takes longer to import than the rest of the tool, so only Parquet reads pay for it
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Reading Parquet manifests needs the pyarrow package (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(path)
+    column = _pick_column(parquet_file.schema_arrow.names, caption_column, Path(path).name)
+    # Rows are compressed in column chunks, so progress is spread evenly over them
+    row_bytes = os.path.getsize(path) / max(1, parquet_file.metadata.num_rows)
+    # Only the caption column is decoded, one row batch at a time
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=[column]):
+        for value in batch.column(0).to_pylist():
+            yield value, row_bytes
+
+# Suffix -> reader(path, caption_column) yielding (caption value, bytes consumed).
+# New formats plug in here.
+CAPTION_MANIFEST_READERS = {
+    ".jsonl": _iter_jsonl,
+    ".csv": _iter_csv,
+    ".tsv": _iter_tsv,
+    ".parquet": _iter_parquet,
+}
+
+def is_caption_manifest(path):
+    return Path(path).suffix.lower() in CAPTION_MANIFEST_READERS and Path(path).is_file()
+
+def find_folder_manifest(folder):
+    """Return the metadata.jsonl/.csv/.parquet caption manifest of a dataset folder, if it has one."""
+    for name in FOLDER_MANIFEST_NAMES:
+        path = Path(folder) / name
+        if path.is_file():
+            return path
+    return None
+
+def manifest_dataset_name(path):
+    """Folder-style name for a manifest: its own stem, or its folder's name for metadata.* files."""
+    path = Path(path)
+    return path.parent.resolve().name if path.stem == "metadata" else path.stem
+
+def iter_manifest_captions(path, caption_column=None):
+    """Stream (caption, bytes) rows from a caption manifest in one sequential read.
+
+    caption is the column's value as stored: a string, a list of tags, or
+    None when the row has no caption.
+    """
+    reader = CAPTION_MANIFEST_READERS.get(Path(path).suffix.lower())
+    if reader is None:
+        raise ValueError(f"Unsupported caption manifest: {os.fspath(path)}")
+    return reader(path, caption_column or None)
@@ -0,0 +1,105 @@
+import os
+import posixpath
+import tarfile
+import zipfile
+from pathlib import Path
+
+from dataset_listing import IMAGE_EXTENSIONS, CAPTION_EXTENSION
+
+ARCHIVE_SUFFIXES = (
+    ".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar.zst", ".tzst",
+)
+ZSTD_SUFFIXES = (".tar.zst", ".tzst")
+
+def _archive_suffix(path):
+    name = Path(path).name.lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+def is_dataset_archive(path):
+    return _archive_suffix(path) is not None and Path(path).is_file()
+
+def archive_stem(path):
+    """Archive name without its (possibly double) suffix, e.g. "my_char" for my_char.tar.gz."""
+    name = Path(path).name
+    suffix = _archive_suffix(path)
+    return name[:-len(suffix)] if suffix else Path(path).stem
+
+def _classify(member_name):
+    """Return (folder, stem, is_caption) for image/caption members, or None for anything else."""
+    folder, name = posixpath.split(member_name)
+    # Dotfiles and macOS resource forks, matching the folder scan
+    if name.startswith(".") or folder.split("/", 1)[0] == "__MACOSX":
+        return None
+    stem, ext = posixpath.splitext(name)
+    ext = ext.lower()
+    if ext == CAPTION_EXTENSION:
+        return folder, stem, True
+    if ext in IMAGE_EXTENSIONS:
+        return folder, stem, False
+    return None
+
+def _decode(data):
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+def _iter_zip(path):
+    # The central directory lists every member up front, so image members
+    # are never read or decompressed
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            kind = _classify(info.filename)
+            if kind is None:
+                continue
+            folder, stem, is_caption = kind
+            yield folder, stem, is_caption, _decode(zf.read(info)) if is_caption else None
+
+def _iter_tar(tf):
+    for member in tf:
+        if member.isfile():
+            kind = _classify(member.name)
+            if kind is not None:
+                folder, stem, is_caption = kind
+                text = None
+                if is_caption:
+                    text = _decode(tf.extractfile(member).read())
+                yield folder, stem, is_caption, text
+        # TarFile keeps every member it has seen; drop them so memory stays
+        # flat on archives with millions of files
+        tf.members = []
+
+def iter_archive_members(path):
+    """Yield (folder, stem, is_caption, caption text) for the image and caption members of a dataset archive.
+
+    Captions come with their decoded text (None when not UTF-8), images with
+    None. Zip and uncompressed tar archives skip image data without reading
+    it; compressed tar streams have to decompress through it, but nothing is
+    ever written to disk.
+    """
+    suffix = _archive_suffix(path)
+    if suffix == ".zip":
+        yield from _iter_zip(path)
+    elif suffix == ".tar":
+        # Random-access mode seeks over member data instead of reading it
+        with tarfile.open(path, "r:") as tf:
+            yield from _iter_tar(tf)
+    elif suffix in ZSTD_SUFFIXES:
+        # Imported here so headless commands that never open a .tar.zst start fast
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading .tar.zst archives needs the zstandard package (pip install zstandard)")
+        with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as stream:
+            with tarfile.open(fileobj=stream, mode="r|") as tf:
+                yield from _iter_tar(tf)
+    elif suffix is not None:
+        with tarfile.open(path, "r|*") as tf:
+            yield from _iter_tar(tf)
+    else:
+        raise ValueError(f"Not a dataset archive: {os.fspath(path)}")
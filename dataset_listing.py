@@ -0,0 +1,61 @@
+import os
+
+IMAGE_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".avif", ".jxl", ".tif", ".tiff",
+})
+CAPTION_EXTENSION = ".txt"
+
+class DatasetListing:
+    """Images and captions of one dataset folder, indexed by file stem."""
+
+    def __init__(self, path):
+        self.path = path
+        self.captions = {}
+        self.images = {}
+        # {caption file name: (size, mtime_ns)}, only filled when stats were requested
+        self.caption_stats = {}
+
+    @property
+    def caption_paths(self):
+        return [os.path.join(self.path, name) for name in self.captions.values()]
+
+    @property
+    def image_paths(self):
+        return [os.path.join(self.path, name) for name in self.images.values()]
+
+    @property
+    def image_count(self):
+        return len(self.images)
+
+    def images_without_captions(self):
+        return [name for stem, name in self.images.items() if stem not in self.captions]
+
+    def orphan_captions(self):
+        return [name for stem, name in self.captions.items() if stem not in self.images]
+
+def list_dataset_folder(path, with_stats=False):
+    """Classify a dataset folder's files in a single os.scandir pass.
+
+    Images are paired with captions through stem-keyed dicts rather than a
+    per-image exists() check. Only caption files are stat'ed, and only when
+    with_stats is set (the scan cache needs their size and mtime).
+    """
+    listing = DatasetListing(path)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            name = entry.name
+            # Skip dotfiles, matching Path.glob("*.txt")
+            if name.startswith("."):
+                continue
+            stem, ext = os.path.splitext(name)
+            ext = ext.lower()
+            if ext == CAPTION_EXTENSION:
+                if not entry.is_file():
+                    continue
+                listing.captions[stem] = name
+                if with_stats:
+                    st = entry.stat()
+                    listing.caption_stats[name] = (st.st_size, st.st_mtime_ns)
+            elif ext in IMAGE_EXTENSIONS and entry.is_file():
+                listing.images[stem] = name
+    return listing
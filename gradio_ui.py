@@ -1,88 +1,88 @@
 import gradio as gr
-import json
-from pathlib import Path
-from collections import Counter
-from safetensors import safe_open
-from safetensors.torch import save_file
+import html
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 
-class MetadataInjector:
-    def __init__(self):
-        self.base_dir = Path(__file__).parent
-        self.dataset_dir = self.base_dir / "Model to Repair"
-        self.output_dir = self.base_dir / "Updated LoRA"
-        self.dataset_dir.mkdir(exist_ok=True)
-        self.output_dir.mkdir(exist_ok=True)
-        
-    def scan_dataset(self, subfolder_name):
-        # Check if it's an absolute path or a subfolder name
-        if Path(subfolder_name).is_absolute():
-            dataset_path = Path(subfolder_name)
-        else:
-            dataset_path = self.dataset_dir / subfolder_name
-        
-        if not dataset_path.exists():
-            return None, f"[ERROR] Dataset folder not found: {dataset_path}"
-        
-        tag_counter = Counter()
-        image_count = 0
-        
-        for txt_file in dataset_path.glob("*.txt"):
-            try:
-                with open(txt_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    tags = [tag.strip() for tag in content.split(',') if tag.strip()]
-                    tag_counter.update(tags)
-                    image_count += 1
-            except Exception as e:
-                continue
-        
-        if image_count == 0:
-            return None, f"[ERROR] No caption files found in {dataset_path}"
-        
-        return dict(tag_counter), f"[OK] Found {image_count} images with {len(tag_counter)} unique tags"
+from Metadata_Injection import MetadataInjector, merge_folder_tags
+from progress import OperationProgress
+from instrumentation import RunStats
+from job_queue import InjectionScheduler, DEFAULT_MEMORY_BUDGET
+from dataset_archive import is_dataset_archive
+from caption_manifest import is_caption_manifest
+from tag_normalization import make_tag_normalizer
+from tag_table import (
+    query_tag_page,
+    summarize_tags,
+    SORT_COUNT_DESC,
+    SORT_COUNT_ASC,
+    SORT_NAME_ASC,
+    SORT_NAME_DESC,
+)
+
+# Seconds between progress updates pushed to the browser
+PROGRESS_POLL_INTERVAL = 0.5
+
+def run_with_progress(fn, progress):
+    """Run fn(progress) in a worker thread, yielding None while it runs and then its result.
     
-    def inject_metadata(self, lora_filename, subfolder_name, tag_frequencies):
-        lora_path = self.dataset_dir / lora_filename
-        
-        if not lora_path.exists():
-            return None, f"[ERROR] LoRA file not found: {lora_path}"
-        
+    If the generator is closed early (e.g. the browser went away) the
+    operation is cancelled.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fn, progress)
         try:
-            tensors = {}
-            metadata = {}
-            
-            with safe_open(lora_path, framework="pt", device="cpu") as f:
-                metadata = f.metadata() or {}
-                for key in f.keys():
-                    tensors[key] = f.get_tensor(key)
-            
-            dataset_dirs = {
-                "1_" + subfolder_name: {
-                    "n_repeats": 1,
-                    "img_count": sum(tag_frequencies.values())
-                }
-            }
-            
-            tag_freq = {
-                "1_" + subfolder_name: tag_frequencies
-            }
-            
-            metadata["ss_tag_frequency"] = json.dumps(tag_freq)
-            metadata["ss_dataset_dirs"] = json.dumps(dataset_dirs)
-            metadata["ss_resolution"] = "1024,1024"
-            metadata["ss_num_train_images"] = str(dataset_dirs["1_" + subfolder_name]["img_count"])
-            
-            output_filename = lora_path.stem + "_with_tags.safetensors"
-            output_path = self.output_dir / output_filename
-            
-            save_file(tensors, str(output_path), metadata=metadata)
-            
-            return str(output_path), f"[OK] Successfully created: {output_filename}"
-            
-        except Exception as e:
-            return None, f"[ERROR] Error: {str(e)}"
+            while not wait([future], timeout=PROGRESS_POLL_INTERVAL).done:
+                yield None
+        finally:
+            if not future.done():
+                progress.cancel()
+        yield future.result()
+
+def format_scan_progress(progress):
+    text = html.escape(progress.describe())
+    preview = progress.snapshot()["preview"]
+    if preview:
+        top = ", ".join(f"{html.escape(tag)} ({count})" for tag, count in preview.items())
+        text += f"<br><small>Top tags so far: {top}</small>"
+    return f"<span style='color: #888;'>⏳ {text}</span>"
 
-def live_validate(tags_text, frequency):
+TAG_SORT_CHOICES = [
+    ("Count (high → low)", SORT_COUNT_DESC),
+    ("Count (low → high)", SORT_COUNT_ASC),
+    ("Name (A → Z)", SORT_NAME_ASC),
+    ("Name (Z → A)", SORT_NAME_DESC),
+]
+
+def render_tag_page(tags, search, sort, min_count, page, page_size):
+    """Render one page of the server-side tag table plus its summary line."""
+    tags = tags or {}
+    rows, page, page_count, matched = query_tag_page(
+        tags, search or "", int(min_count or 0), sort or SORT_COUNT_DESC, int(page or 1), int(page_size or 50)
+    )
+    
+    stats = summarize_tags(tags)
+    if not stats["unique"]:
+        return rows, page, "*No tags yet*"
+    summary = (
+        f"**{stats['unique']:,}** unique tags · **{stats['total']:,}** tag occurrences · "
+        f"max **{stats['max']:,}** · median **{stats['median']:,}** · {stats['singletons']:,} tags seen once"
+        f"<br><small>{matched:,} matching · page {page} of {page_count}</small>"
+    )
+    return rows, page, summary
+
+# Loaded normalizers by (enabled, rules path, rules mtime), so their memo carries over between scans
+_tag_normalizers = {}
+
+def get_tag_normalizer(normalize, rules_path):
+    """make_tag_normalizer for the UI options, reloading the rules file only when it changes."""
+    rules_path = (rules_path or "").strip() or None
+    mtime = os.path.getmtime(rules_path) if rules_path and os.path.exists(rules_path) else None
+    key = (bool(normalize), rules_path, mtime)
+    if key not in _tag_normalizers:
+        _tag_normalizers[key] = make_tag_normalizer(bool(normalize), rules_path)
+    return _tag_normalizers[key]
+
+def live_validate(tags_text, frequency, normalize=False, rules_path=None):
     freq = 1
     if frequency is not None:
         try:
@@ -99,12 +99,27 @@ def live_validate(tags_text, frequency):
         parts = [p.strip() for p in cleaned.split(',') if p.strip()]
         
         if parts:
+            try:
+                normalizer = get_tag_normalizer(normalize, rules_path)
+            except (OSError, ValueError) as e:
+                status = f"<span style='color: red;'>[ERROR] Could not load tag rules: {html.escape(str(e))}</span>"
+                return status, interactive, preview
+            
             if len(parts) == 1 and ' ' in parts[0]:
                 status = "<span style='color: #ff9900;'>🔸 Hint: Use commas to separate tags (e.g., blue hair, red eyes)</span>"
+            elif normalizer is not None and not normalizer.normalize_tags(parts):
+                status = "<span style='color: orange;'>⚠️ Every tag was removed by the tag rules</span>"
             else:
+                dropped = 0
+                if normalizer is not None:
+                    normalized = normalizer.normalize_tags(parts)
+                    dropped = len(parts) - len(normalized)
+                    parts = normalized
                 unique = list(dict.fromkeys(parts))
                 dups = len(parts) - len(unique)
                 dup_note = f"<br><small>{dups} duplicate(s) removed</small>" if dups > 0 else ""
+                if dropped:
+                    dup_note += f"<br><small>{dropped} blacklisted tag(s) removed</small>"
                 preview = {tag: freq for tag in unique}
                 count = len(unique)
                 status = f"<span style='color: green;'>🟢 Ready — {count} unique tag{'s' if count != 1 else ''}{dup_note}</span>"
@@ -112,13 +127,16 @@ def live_validate(tags_text, frequency):
         else:
             status = "<span style='color: orange;'>⚠️ No tags detected yet</span>"
     
-    return preview, status, interactive, preview
+    return status, interactive, preview
 
-def create_ui():
-    injector = MetadataInjector()
+def create_ui(inject_workers=2, memory_budget=DEFAULT_MEMORY_BUDGET):
+    # Every session shares one injector, so concurrent injections go through one queue
+    injector = MetadataInjector(scheduler=InjectionScheduler(inject_workers, memory_budget))
     
     with gr.Blocks(title="Dataset Metadata Injection Tool") as demo:
         current_tags = gr.State({})
+        # Per-folder breakdown when a Kohya-style N_name dataset root was scanned
+        current_folders = gr.State(None)
         
         gr.Markdown("""
         # 🏷️ Dataset Metadata Injection Tool
@@ -147,10 +165,10 @@ def create_ui():
                 
                 subfolder_input = gr.Dropdown(
                     label="Dataset Subfolder Name",
-                    choices=[d.name for d in injector.dataset_dir.iterdir() if d.is_dir()],
+                    choices=[d.name for d in injector.dataset_dir.iterdir() if d.is_dir() or is_dataset_archive(d) or is_caption_manifest(d)],
                     value=None,
                     allow_custom_value=True,
-                    info="Select a subfolder or enter a custom path to your dataset",
+                    info="Select a subfolder, .zip/.tar archive or .jsonl/.csv/.parquet caption manifest, or enter a custom path to your dataset",
                     visible=True
                 )
                 
@@ -175,9 +193,106 @@ def create_ui():
                 with gr.Row():
                     scan_btn = gr.Button("🔍 Scan Dataset / Parse Tags", variant="primary", size="lg", visible=True, scale=3)
                     select_folder_btn = gr.Button("📁 Select Dataset Folder", size="lg", visible=True, scale=1)
+                    cancel_btn = gr.Button("⏹ Cancel", size="lg", variant="stop", scale=1)
+                
+                scan_workers_input = gr.Number(
+                    label="Scan Workers",
+                    value=1,
+                    minimum=1,
+                    step=1,
+                    precision=0,
+                    visible=True,
+                    info="Read caption files in parallel (helps on network storage)"
+                )
+                
+                approx_top_input = gr.Number(
+                    label="Approximate Top Tags (0 = exact)",
+                    value=0,
+                    minimum=0,
+                    step=100,
+                    precision=0,
+                    visible=True,
+                    info="For huge datasets: keep only the N most frequent tags using bounded memory"
+                )
+                
+                probe_resolution_input = gr.Checkbox(
+                    label="Probe image resolutions",
+                    value=False,
+                    visible=True,
+                    info="Read image headers to set ss_resolution and bucket stats instead of 1024,1024"
+                )
+                
+                use_cache_input = gr.Checkbox(
+                    label="Use scan cache",
+                    value=True,
+                    visible=True,
+                    info="Remember each caption's tags so rescans only reread changed files (the first scan pays for writing it)"
+                )
+                
+                with gr.Row(visible=True) as manifest_options:
+                    caption_column_input = gr.Textbox(
+                        label="Manifest Caption Column",
+                        value="",
+                        placeholder="caption",
+                        info="Column holding the captions in .jsonl/.csv/.parquet manifests (blank = caption, text, tags or prompt)"
+                    )
+                    caption_separator_input = gr.Textbox(
+                        label="Manifest Tag Separator",
+                        value=",",
+                        info="Separator between tags inside a manifest caption"
+                    )
+                
+                with gr.Row():
+                    normalize_tags_input = gr.Checkbox(
+                        label="Normalize tags",
+                        value=False,
+                        info="Lowercase tags and treat underscores as spaces, so Blue_Hair and blue hair count as one tag"
+                    )
+                    tag_rules_input = gr.Textbox(
+                        label="Tag Rules File",
+                        value="",
+                        placeholder="tag_rules.json",
+                        info="Optional .json rules (aliases, blacklist, regex rewrites) or .csv alias map; implies normalization"
+                    )
                 
                 gr.Markdown("### 🚀 Step 3: Inject Metadata")
                 
+                in_place_mode = gr.Checkbox(
+                    label="Patch in place when the header has room",
+                    value=False,
+                    info="Rewrites only the header of the original LoRA instead of saving a copy"
+                )
+                
+                write_hashes_mode = gr.Checkbox(
+                    label="Write model hashes (sshs_model_hash / sshs_legacy_hash)",
+                    value=True,
+                    info="Kept from the source when it has them; otherwise computed while copying, which rules out zero-copy"
+                )
+                
+                force_mode = gr.Checkbox(
+                    label="Rewrite even if up to date",
+                    value=False,
+                    info="Outputs written from the same LoRA, dataset tags and options are skipped unless this is ticked"
+                )
+                
+                verify_hash_mode = gr.Checkbox(
+                    label="Verify output payload hash",
+                    value=False,
+                    info="Rereads the saved LoRA and checks its tensor data against the original"
+                )
+                
+                with gr.Row():
+                    max_tags_input = gr.Number(
+                        label="Max Tags per Folder",
+                        value=0, minimum=0, precision=0,
+                        info="Keep only the most frequent tags in ss_tag_frequency (0 = all)"
+                    )
+                    header_budget_input = gr.Number(
+                        label="Header Budget (KB)",
+                        value=0, minimum=0, precision=0,
+                        info="Drop the least frequent tags until the header fits (0 = no limit)"
+                    )
+                
                 inject_btn = gr.Button("💾 Inject Metadata & Save", variant="primary", size="lg", interactive=False)
                 
                 output_status = gr.Textbox(label="Output Status", interactive=False, lines=4)
@@ -187,16 +302,28 @@ def create_ui():
             with gr.Column(scale=1):
                 gr.Markdown("### 🏷️ Step 2: Review Tags")
                 
-                tag_display = gr.JSON(
+                # The full tag table stays server-side in current_tags; only
+                # one filtered/sorted page is ever sent to the browser
+                with gr.Row():
+                    tag_search = gr.Textbox(label="Search Tags", placeholder="substring…", scale=2)
+                    tag_sort = gr.Dropdown(label="Sort By", choices=TAG_SORT_CHOICES, value=SORT_COUNT_DESC, scale=2)
+                    tag_min_count = gr.Number(label="Min Count", value=0, minimum=0, precision=0, scale=1)
+                
+                tag_table = gr.Dataframe(
                     label="Tag Frequencies",
-                    value={}
+                    headers=["Tag", "Count"],
+                    datatype=["str", "number"],
+                    value=[],
+                    interactive=False
                 )
                 
-                manual_preview = gr.JSON(
-                    label="Tag Frequencies (Live Preview)",
-                    value={},
-                    visible=False
-                )
+                with gr.Row():
+                    tag_prev_btn = gr.Button("◀ Prev", size="sm")
+                    tag_page = gr.Number(label="Page", value=1, minimum=1, precision=0)
+                    tag_page_size = gr.Dropdown(label="Per Page", choices=[25, 50, 100, 250], value=50)
+                    tag_next_btn = gr.Button("Next ▶", size="sm")
+                
+                tag_summary = gr.Markdown("*No tags yet*")
                 
                 review_status = gr.Markdown("")
                 
@@ -267,11 +394,15 @@ def create_ui():
                 tag_frequency_input: gr.update(visible=is_manual),
                 scan_btn: gr.update(visible=not is_manual),
                 select_folder_btn: gr.update(visible=not is_manual),
-                tag_display: gr.update(visible=not is_manual, value={}),
-                manual_preview: gr.update(visible=is_manual, value={}),
+                scan_workers_input: gr.update(visible=not is_manual),
+                approx_top_input: gr.update(visible=not is_manual),
+                probe_resolution_input: gr.update(visible=not is_manual),
+                use_cache_input: gr.update(visible=not is_manual),
+                manifest_options: gr.update(visible=not is_manual),
                 review_status: gr.update(value=""),
                 inject_btn: gr.update(interactive=False),
                 current_tags: {},
+                current_folders: None,
                 instructions_display: gr.update(value=instructions_text)
             }
         
@@ -300,21 +431,55 @@ def create_ui():
                 # Fallback if tkinter not available
                 return gr.update()
         
-        def scan_dataset_handler(is_manual, subfolder, lora_file):
+        # Running operation per browser session, so Cancel stops the right one
+        running = {}
+        
+        def cancel_handler(request: gr.Request):
+            progress = running.get(request.session_hash)
+            if progress is not None:
+                progress.cancel()
+        
+        def scan_dataset_handler(is_manual, subfolder, lora_file, scan_workers, approx_top, probe_resolution, use_cache,
+                                 caption_column, caption_separator, normalize, rules_path, request: gr.Request):
             if not lora_file:
                 status = "⚠️ [WARNING] Please select a LoRA file"
-                return {}, status, gr.update(interactive=False), {}
+                yield status, gr.update(interactive=False), {}, None
+                return
             
             if is_manual:
                 status = "<span style='color: orange;'>In manual mode, use the live preview — no scan needed</span>"
-                return {}, status, gr.update(interactive=False), {}
+                yield status, gr.update(interactive=False), {}, None
+                return
             
             if not subfolder:
                 status = "⚠️ [WARNING] Please select a dataset subfolder"
-                return {}, status, gr.update(interactive=False), {}
+                yield status, gr.update(interactive=False), {}, None
+                return
+            
+            try:
+                normalizer = get_tag_normalizer(normalize, rules_path)
+            except (OSError, ValueError) as e:
+                status = f"<span style='color: red;'>[ERROR] Could not load tag rules: {html.escape(str(e))}</span>"
+                yield status, gr.update(interactive=False), {}, None
+                return
+            
+            progress = OperationProgress()
+            stats = RunStats("scan")
+            running[request.session_hash] = progress
+            try:
+                scan = lambda p: injector.scan_dataset_folders(
+                    subfolder, workers=int(scan_workers or 1), use_cache=bool(use_cache),
+                    approximate_top=int(approx_top or 0), progress=p, probe_resolution=bool(probe_resolution), caption_column=(caption_column or "").strip() or None,
+                    caption_separator=caption_separator or ",", stats=stats, normalizer=normalizer
+                )
+                for result in run_with_progress(scan, progress):
+                    if result is None:
+                        yield format_scan_progress(progress), gr.update(interactive=False), gr.update(), gr.update()
+                folders, status = result
+            finally:
+                running.pop(request.session_hash, None)
             
-            tags, status = injector.scan_dataset(subfolder)
-            success = tags is not None
+            success = folders is not None
             
             if success:
                 status = f"<span style='color: green;'>{status}</span>"
@@ -322,65 +487,134 @@ def create_ui():
             else:
                 status = f"<span style='color: red;'>{status}</span>"
                 interactive = gr.update(interactive=False)
+            status += f"<br><small>⏱ {html.escape(stats.summary())}</small>"
+            
+            tags = merge_folder_tags(folders) if success else {}
             
-            return tags or {}, status, interactive, tags or {}
+            yield status, interactive, tags, folders
         
-        def inject_handler(is_manual, lora_file, subfolder, tags):
+        def inject_handler(is_manual, lora_file, subfolder, tags, folders, in_place, write_hashes, force, verify_hash,
+                           max_tags, header_budget_kb, request: gr.Request):
             if not tags:
-                return "[WARNING] No tags to inject — please scan or enter tags first", ""
+                yield "[WARNING] No tags to inject — please scan or enter tags first", ""
+                return
             
             if not lora_file:
-                return "[WARNING] Missing LoRA file", ""
+                yield "[WARNING] Missing LoRA file", ""
+                return
             
             folder_name = "manual_tags" if is_manual else subfolder
             
             if not is_manual and not subfolder:
-                return "[WARNING] Missing dataset subfolder", ""
+                yield "[WARNING] Missing dataset subfolder", ""
+                return
+            
+            progress = OperationProgress()
+            stats = RunStats("inject")
+            running[request.session_hash] = progress
+            try:
+                inject = lambda p: injector.inject_metadata(
+                    lora_file, folder_name, tags, in_place=in_place, progress=p, skip_unchanged=not force,
+                    write_hashes=bool(write_hashes), verify_hashes=verify_hash,
+                    dataset_folders=None if is_manual else folders, stats=stats,
+                    max_tags_per_folder=int(max_tags) if max_tags else None,
+                    header_budget=int(header_budget_kb) * 1024 if header_budget_kb else None
+                )
+                for result in run_with_progress(inject, progress):
+                    if result is None:
+                        yield f"⏳ {progress.describe()}", ""
+                output_path_result, status = result
+            finally:
+                running.pop(request.session_hash, None)
             
-            output_path_result, status = injector.inject_metadata(lora_file, folder_name, tags)
-            return status, output_path_result or ""
+            yield f"{status}\n⏱ {stats.summary()}", output_path_result or ""
+        
+        # Tag table paging: any filter/sort change jumps back to page 1
+        table_controls = [tag_search, tag_sort, tag_min_count]
+        table_outputs = [tag_table, tag_page, tag_summary]
+        show_first_page = dict(
+            fn=lambda tags, search, sort, min_count, page_size: render_tag_page(tags, search, sort, min_count, 1, page_size),
+            inputs=[current_tags] + table_controls + [tag_page_size],
+            outputs=table_outputs
+        )
+        
+        for control in table_controls + [tag_page_size]:
+            control.change(**show_first_page)
+        
+        tag_page.submit(
+            fn=render_tag_page,
+            inputs=[current_tags] + table_controls + [tag_page, tag_page_size],
+            outputs=table_outputs
+        )
+        
+        tag_prev_btn.click(
+            fn=lambda tags, search, sort, min_count, page, page_size: render_tag_page(
+                tags, search, sort, min_count, int(page or 1) - 1, page_size),
+            inputs=[current_tags] + table_controls + [tag_page, tag_page_size],
+            outputs=table_outputs
+        )
+        
+        tag_next_btn.click(
+            fn=lambda tags, search, sort, min_count, page, page_size: render_tag_page(
+                tags, search, sort, min_count, int(page or 1) + 1, page_size),
+            inputs=[current_tags] + table_controls + [tag_page, tag_page_size],
+            outputs=table_outputs
+        )
         
         # Connect event handlers
         manual_mode.change(
             fn=toggle_manual_mode,
             inputs=[manual_mode],
             outputs=[subfolder_input, manual_tags_input, tag_frequency_input, scan_btn,
-                     select_folder_btn, tag_display, manual_preview, review_status, inject_btn, current_tags, instructions_display]
-        )
+                     select_folder_btn, scan_workers_input, approx_top_input, probe_resolution_input, use_cache_input,
+                     manifest_options,
+                     review_status, inject_btn, current_tags, current_folders, instructions_display]
+        ).then(**show_first_page)
+        
+        live_validate_inputs = [manual_tags_input, tag_frequency_input, normalize_tags_input, tag_rules_input]
         
         manual_tags_input.change(
             fn=live_validate,
-            inputs=[manual_tags_input, tag_frequency_input],
-            outputs=[manual_preview, review_status, inject_btn, current_tags]
-        )
+            inputs=live_validate_inputs,
+            outputs=[review_status, inject_btn, current_tags]
+        ).then(**show_first_page)
         
         tag_frequency_input.change(
             fn=live_validate,
-            inputs=[manual_tags_input, tag_frequency_input],
-            outputs=[manual_preview, review_status, inject_btn, current_tags]
-        )
+            inputs=live_validate_inputs,
+            outputs=[review_status, inject_btn, current_tags]
+        ).then(**show_first_page)
         
         select_folder_btn.click(
             fn=select_dataset_folder,
             outputs=[subfolder_input]
         )
         
+        cancel_btn.click(
+            fn=cancel_handler,
+            queue=False
+        )
+        
         scan_btn.click(
             fn=scan_dataset_handler,
-            inputs=[manual_mode, subfolder_input, lora_input],
-            outputs=[tag_display, review_status, inject_btn, current_tags]
-        )
+            inputs=[manual_mode, subfolder_input, lora_input, scan_workers_input, approx_top_input, probe_resolution_input,
+                    use_cache_input, caption_column_input, caption_separator_input, normalize_tags_input, tag_rules_input],
+            outputs=[review_status, inject_btn, current_tags, current_folders]
+        ).then(**show_first_page)
         
         inject_btn.click(
             fn=inject_handler,
-            inputs=[manual_mode, lora_input, subfolder_input, current_tags],
-            outputs=[output_status, output_path]
+            inputs=[manual_mode, lora_input, subfolder_input, current_tags, current_folders, in_place_mode,
+                    write_hashes_mode, force_mode, verify_hash_mode, max_tags_input, header_budget_input],
+            outputs=[output_status, output_path],
+            # The injection scheduler limits concurrency and reports queue positions
+            concurrency_limit=None
         )
     
     return demo
 
-if __name__ == "__main__":
-    demo = create_ui()
+def main(inject_workers=2, memory_budget=DEFAULT_MEMORY_BUDGET):
+    demo = create_ui(inject_workers, memory_budget)
     demo.launch(
         server_name="127.0.0.1",
         server_port=7860,
@@ -388,3 +622,6 @@ if __name__ == "__main__":
         show_error=True,
         theme=gr.themes.Soft()
     )
+
+if __name__ == "__main__":
+    main()
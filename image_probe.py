@@ -0,0 +1,151 @@
+import math
+import struct
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Enough for the PNG/GIF/BMP/WebP size fields; JPEG walks its segments instead
+PROBE_READ_SIZE = 64
+# Images per task handed to the probe thread pool
+PROBE_BATCH_SIZE = 256
+# Kohya's default bucket_reso_steps
+BUCKET_STEP = 64
+
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _jpeg_size(f):
+    # Walk the segment headers, seeking over EXIF/ICC payloads, until a SOFn
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0xD9 or marker == 0xDA:
+            return None
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and head[20] == 0x2F:
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+def probe_image_size(path):
+    """Return (width, height) read from the image's header bytes, or None.
+
+    Only the header is read, no pixels are decoded. PNG, JPEG, WebP, GIF and
+    BMP are recognised by their signature, not their extension.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(PROBE_READ_SIZE)
+            if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:3] == b'\xff\xd8\xff':
+                return _jpeg_size(f)
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                return _webp_size(head)
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head[:2] == b'BM':
+                if struct.unpack('<I', head[14:18])[0] == 12:
+                    return struct.unpack('<HH', head[18:22])
+                width, height = struct.unpack('<ii', head[18:26])
+                # Negative heights mark top-down bitmaps
+                return width, abs(height)
+    except (OSError, struct.error, IndexError):
+        pass
+    return None
+
+def _probe_batch(paths):
+    sizes = Counter()
+    failed = 0
+    for path in paths:
+        size = probe_image_size(path)
+        if size and size[0] > 0 and size[1] > 0:
+            sizes[size] += 1
+        else:
+            failed += 1
+    return sizes, failed
+
+def probe_image_sizes(paths, workers=1, progress=None):
+    """Probe many images and return ({(width, height): image count}, unreadable count)."""
+    paths = list(paths)
+    if progress is not None:
+        progress.start("Probing image sizes", items_total=len(paths))
+    batches = [paths[i:i + PROBE_BATCH_SIZE] for i in range(0, len(paths), PROBE_BATCH_SIZE)]
+
+    sizes = Counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers or 1)) as executor:
+        for batch, (batch_sizes, batch_failed) in zip(batches, executor.map(_probe_batch, batches)):
+            sizes.update(batch_sizes)
+            failed += batch_failed
+            if progress is not None:
+                progress.advance(len(batch))
+    return sizes, failed
+
+def bucket_for(size, resolution, step=BUCKET_STEP):
+    """Approximate Kohya aspect-ratio bucket for an image at a training resolution.
+
+    The image is scaled to the resolution's area (never up) and each side is
+    rounded down to a multiple of step.
+    """
+    width, height = size
+    scale = min(1.0, math.sqrt(resolution[0] * resolution[1] / (width * height)))
+    return (
+        max(step, int(width * scale) // step * step),
+        max(step, int(height * scale) // step * step),
+    )
+
+def summarize_resolutions(size_counts, max_resolution=(1024, 1024), step=BUCKET_STEP):
+    """Derive ss_resolution and Kohya-style ss_bucket_info from probed image sizes.
+
+    The resolution is the largest square (in step increments) that the median
+    image covers, capped at max_resolution.
+    """
+    areas = sorted((width * height, count) for (width, height), count in size_counts.items())
+    total = sum(count for _, count in areas)
+    if not total:
+        return None
+
+    seen = 0
+    for area, count in areas:
+        seen += count
+        if seen * 2 >= total:
+            median_area = area
+            break
+    side = max(step, min(max_resolution[0], int(math.sqrt(median_area)) // step * step))
+    resolution = (side, min(side, max_resolution[1]))
+
+    buckets = Counter()
+    ar_error = 0.0
+    for size, count in size_counts.items():
+        bucket = bucket_for(size, resolution, step)
+        buckets[bucket] += count
+        ar_error += abs(size[0] / size[1] - bucket[0] / bucket[1]) * count
+
+    bucket_info = {
+        "buckets": {
+            str(i): {"resolution": list(bucket), "count": count}
+            for i, (bucket, count) in enumerate(sorted(buckets.items()))
+        },
+        "mean_img_ar_error": ar_error / total,
+    }
+    return resolution, bucket_info
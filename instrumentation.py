@@ -0,0 +1,162 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# Comma-separated profilers to run around each scan/injection, e.g. "cprofile,tracemalloc"
+PROFILE_ENV = "LORA_METADATA_PROFILE"
+# Where profile dumps go (default: .profiles/ next to the scripts)
+PROFILE_DIR_ENV = "LORA_METADATA_PROFILE_DIR"
+# Allocation sites listed in a tracemalloc report
+TRACEMALLOC_TOP = 25
+
+_log_lock = threading.Lock()
+
+class RunStats:
+    """Per-stage timings and counters of one scan or injection.
+
+    Stages timed from several worker threads add up, so their sum can exceed
+    the run's wall-clock time.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {}
+        self.counters = {}
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_record(self):
+        record = {
+            "operation": self.operation,
+            "seconds": round(self.seconds, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+        if self.profiles:
+            record["profiles"] = list(self.profiles)
+        return record
+
+    def summary(self):
+        """One line for status messages, e.g. "scan 0.52s: list 0.010s · read 0.420s (1.2 MB caption, 3000 captions)"."""
+        parts = [f"{name} {seconds:.3f}s" for name, seconds in self.stages.items()]
+        counts = []
+        for name, value in self.counters.items():
+            if name.endswith("_bytes"):
+                label = name[:-len("_bytes")].replace("_", " ")
+                if value < 1024 * 1024:
+                    counts.append(f"{value / 1024:.1f} KB {label}")
+                else:
+                    counts.append(f"{value / (1024 * 1024):.1f} MB {label}")
+            else:
+                counts.append(f"{value} {name.replace('_', ' ')}")
+        text = f"{self.operation} {self.seconds:.2f}s: " + (" · ".join(parts) or "no stages")
+        if counts:
+            text += f" ({', '.join(counts)})"
+        if self.profiles:
+            text += f"; profile: {', '.join(self.profiles)}"
+        return text
+
+def timed(stats, name):
+    """stats.stage(name), or a no-op when stats is None."""
+    return stats.stage(name) if stats is not None else nullcontext()
+
+def profile_modes():
+    return {mode.strip().lower() for mode in os.environ.get(PROFILE_ENV, "").split(",") if mode.strip()}
+
+@contextmanager
+def profiled(operation, stats=None, default_dir=None):
+    """Run the block under cProfile and/or tracemalloc when LORA_METADATA_PROFILE asks for it.
+
+    cProfile only sees the calling thread, so worker pools show up as waits;
+    tracemalloc covers every thread. Dumps are written to
+    LORA_METADATA_PROFILE_DIR and listed in stats.profiles, and the traced
+    peak goes to stats.counters["alloc_peak_bytes"].
+    """
+    modes = profile_modes()
+    if not modes:
+        yield
+        return
+
+    out_dir = Path(os.environ.get(PROFILE_DIR_ENV) or default_dir or Path(__file__).parent / ".profiles")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = out_dir / f"{operation}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{threading.get_ident()}"
+
+    profiler = None
+    if "cprofile" in modes:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this process
+            profiler = None
+    started_tracing = False
+    if "tracemalloc" in modes:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+
+    try:
+        yield
+    finally:
+        written = []
+        if profiler is not None:
+            profiler.disable()
+        # Snapshot before dumping the profile so its allocations stay out of the report
+        if "tracemalloc" in modes and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            path = base.with_name(base.name + ".tracemalloc.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"peak traced memory: {peak} bytes\n")
+                for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+            written.append(str(path))
+            if stats is not None:
+                stats.count("alloc_peak_bytes", peak)
+        if profiler is not None:
+            path = base.with_name(base.name + ".prof")
+            profiler.dump_stats(path)
+            written.append(str(path))
+        if stats is not None:
+            stats.profiles.extend(written)
+
+def append_timings_log(log_path, records):
+    """Append records to a JSON-lines timings log, one object per line."""
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    with _log_lock:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
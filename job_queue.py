@@ -0,0 +1,99 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from safetensors_io import COPY_CHUNK_SIZE
+
+# Parsing a JSON header into Python objects takes several times its size
+HEADER_MEMORY_FACTOR = 8
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+def estimate_injection_memory(header_length, data_length, chunk_size=COPY_CHUNK_SIZE):
+    """Peak memory of one injection: the parsed header plus one payload chunk in flight.
+
+    Payloads are streamed, so only a single chunk of the tensor data (never
+    more than the data itself) is held at a time.
+    """
+    return HEADER_MEMORY_FACTOR * header_length + min(data_length, chunk_size)
+
+class _Job:
+    def __init__(self, keys, memory):
+        self.keys = keys
+        self.memory = memory
+        self.admitted = False
+
+class InjectionScheduler:
+    """Admits injection jobs under a worker limit, a memory budget and per-file locks.
+
+    Jobs are admitted in arrival order. A job waiting only for a file lock
+    lets later jobs on other files go ahead, but a job waiting for a worker or
+    memory holds back everyone behind it so large jobs can't be starved. A
+    job larger than the whole budget still runs once nothing else is running.
+    """
+
+    # Seconds between cancellation checks while a job waits
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, max_workers=2, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.max_workers = max(1, int(max_workers))
+        self.memory_budget = memory_budget
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = []
+        self._memory_in_use = 0
+        self._locked = set()
+
+    def _admit_waiting(self):
+        for job in list(self._waiting):
+            if len(self._running) >= self.max_workers:
+                break
+            if self._running and self._memory_in_use + job.memory > self.memory_budget:
+                break
+            if self._locked & job.keys:
+                continue
+            self._waiting.remove(job)
+            self._running.append(job)
+            self._memory_in_use += job.memory
+            self._locked |= job.keys
+            job.admitted = True
+        self._cond.notify_all()
+
+    def _release(self, job):
+        self._running.remove(job)
+        self._memory_in_use -= job.memory
+        self._locked -= job.keys
+        self._admit_waiting()
+
+    @contextmanager
+    def slot(self, paths, memory=0, progress=None):
+        """Block until the job touching paths is admitted, then hold its slot and file locks.
+
+        While queued, progress (an OperationProgress) shows the queue position,
+        and cancelling it abandons the wait with OperationCancelled.
+        """
+        job = _Job(frozenset(os.path.normcase(os.path.abspath(path)) for path in paths), memory)
+        with self._cond:
+            self._waiting.append(job)
+            self._admit_waiting()
+            try:
+                shown = None
+                while not job.admitted:
+                    if progress is not None:
+                        position = (self._waiting.index(job) + 1, len(self._waiting))
+                        if position != shown:
+                            shown = position
+                            progress.start(f"Queued for injection (position {position[0]} of {position[1]})")
+                        progress.check()
+                    self._cond.wait(self.POLL_INTERVAL)
+            except BaseException:
+                if job.admitted:
+                    self._release(job)
+                else:
+                    self._waiting.remove(job)
+                    self._admit_waiting()
+                raise
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release(job)
@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from safetensors_io import read_safetensors_header
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loras (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    has_tag_frequency INTEGER NOT NULL,
+    metadata TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    path TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (tag, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_by_path ON tags (path);
+CREATE INDEX IF NOT EXISTS loras_by_tag_frequency ON loras (has_tag_frequency);
+"""
+
+def list_lora_stats(library_root):
+    """Return {absolute path: (size, mtime_ns)} for every .safetensors under library_root."""
+    stats = {}
+    for dirpath, dirnames, filenames in os.walk(library_root):
+        # Skip hidden folders such as the scan cache
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            if name.endswith(".safetensors") and not name.startswith("."):
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                stats[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+def parse_tag_frequency(metadata):
+    """Merge the per-folder ss_tag_frequency counts of a metadata dict, or None if absent or malformed."""
+    raw = metadata.get("ss_tag_frequency")
+    if not raw:
+        return None
+    try:
+        folders = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(folders, dict):
+        return None
+    merged = Counter()
+    for tag_counts in folders.values():
+        if isinstance(tag_counts, dict):
+            merged.update({tag: count for tag, count in tag_counts.items() if isinstance(count, int)})
+    return dict(merged)
+
+def inspect_lora(path):
+    """Read only the header of a LoRA and return {"path", "metadata", "tag_frequency", "error"}."""
+    try:
+        header, _ = read_safetensors_header(path)
+        metadata = header.get("__metadata__") or {}
+        return {"path": str(path), "metadata": metadata, "tag_frequency": parse_tag_frequency(metadata), "error": None}
+    except Exception as e:
+        return {"path": str(path), "metadata": None, "tag_frequency": None, "error": str(e)}
+
+def update_lora_index(library_root, index_path, workers=8, progress=None):
+    """Bring the tag index of a LoRA library up to date, rereading only headers whose (size, mtime_ns) changed.
+
+    Returns (number of LoRAs indexed, headers read, headers reused, entries removed).
+    """
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+
+    current = list_lora_stats(library_root)
+
+    conn = sqlite3.connect(index_path, timeout=30, isolation_level=None)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+
+        cached = {path: (size, mtime_ns) for path, size, mtime_ns in
+                  conn.execute("SELECT path, size, mtime_ns FROM loras")}
+        changed = sorted(path for path, stat in current.items() if cached.get(path) != stat)
+        removed = [path for path in cached if path not in current]
+
+        def read_changed(path):
+            info = inspect_lora(path)
+            if progress is not None:
+                progress.advance(1)
+            return info
+
+        if progress is not None:
+            progress.start("Reading LoRA headers", items_total=len(changed))
+        if workers and workers > 1 and len(changed) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fresh = list(executor.map(read_changed, changed))
+        else:
+            fresh = [read_changed(path) for path in changed]
+
+        stale = [(path,) for path in removed + changed]
+        conn.executemany("DELETE FROM tags WHERE path = ?", stale)
+        conn.executemany("DELETE FROM loras WHERE path = ?", stale)
+
+        lora_rows = []
+        tag_rows = []
+        for info in fresh:
+            path = info["path"]
+            size, mtime_ns = current[path]
+            tag_frequency = info["tag_frequency"]
+            metadata = json.dumps(info["metadata"]) if info["metadata"] is not None else None
+            lora_rows.append((path, size, mtime_ns, int(bool(tag_frequency)), metadata, info["error"]))
+            if tag_frequency:
+                tag_rows.extend((tag, path, count) for tag, count in tag_frequency.items())
+
+        conn.executemany("INSERT INTO loras VALUES (?, ?, ?, ?, ?, ?)", lora_rows)
+        conn.executemany("INSERT INTO tags VALUES (?, ?, ?)", tag_rows)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return len(current), len(changed), len(current) - len(changed), len(removed)
+
+def _query(index_path, sql, params=()):
+    conn = sqlite3.connect(index_path, timeout=30)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+def find_loras_with_tag(index_path, tag):
+    """Return [(path, count)] of every indexed LoRA trained on tag, most occurrences first."""
+    return _query(index_path, "SELECT path, count FROM tags WHERE tag = ? ORDER BY count DESC, path", (tag,))
+
+def find_loras_without_tag_frequency(index_path):
+    """Return the readable indexed LoRAs that have no usable ss_tag_frequency."""
+    rows = _query(index_path, "SELECT path FROM loras WHERE has_tag_frequency = 0 AND error IS NULL ORDER BY path")
+    return [path for (path,) in rows]
+
+def find_unreadable_loras(index_path):
+    return _query(index_path, "SELECT path, error FROM loras WHERE error IS NOT NULL ORDER BY path")
+
+def top_library_tags(index_path, limit=20):
+    """Return [(tag, number of LoRAs, total count)] for the tags used by the most LoRAs."""
+    return _query(
+        index_path,
+        "SELECT tag, COUNT(*) AS loras, SUM(count) FROM tags GROUP BY tag ORDER BY loras DESC, tag LIMIT ?",
+        (limit,)
+    )
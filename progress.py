@@ -0,0 +1,165 @@
+import heapq
+import threading
+import time
+from collections import Counter
+
+class OperationCancelled(Exception):
+    pass
+
+class OperationProgress:
+    """Progress counters shared between a running scan/inject and whoever polls it.
+
+    The worker calls advance() as it goes, which also raises OperationCancelled
+    once cancel() has been called from another thread.
+    """
+
+    # Seconds between running top-N tag snapshots
+    PREVIEW_INTERVAL = 0.5
+
+    def __init__(self, preview_size=10):
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self.started = time.perf_counter()
+        self.stage = ""
+        self.items_done = 0
+        self.items_total = None
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.preview_size = preview_size
+        self.preview = {}
+        self._source_previews = {}
+        self._last_preview = 0.0
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise OperationCancelled()
+
+    def start(self, stage, items_total=None, bytes_total=None):
+        with self._lock:
+            self.stage = stage
+            self.started = time.perf_counter()
+            self.items_done = 0
+            self.items_total = items_total
+            self.bytes_done = 0
+            self.bytes_total = bytes_total
+        self.check()
+
+    def add_totals(self, items=0, nbytes=0):
+        """Grow the expected totals, e.g. as nested operations discover their work."""
+        with self._lock:
+            self.items_total = (self.items_total or 0) + items
+            self.bytes_total = (self.bytes_total or 0) + nbytes
+
+    def advance(self, items=0, nbytes=0):
+        with self._lock:
+            self.items_done += items
+            self.bytes_done += nbytes
+        self.check()
+
+    def wants_preview(self):
+        return time.perf_counter() - self._last_preview >= self.PREVIEW_INTERVAL
+
+    def set_preview(self, tag_counts, source=None):
+        """Store the top tags of a {tag: count} snapshot taken by the worker.
+        
+        Concurrent sub-operations pass their own source key; the preview is
+        then the sum of each source's latest top tags.
+        """
+        top = heapq.nlargest(self.preview_size, tag_counts.items(), key=lambda item: item[1])
+        with self._lock:
+            if source is None:
+                self.preview = dict(top)
+            else:
+                self._source_previews[source] = top
+                merged = Counter()
+                for source_top in self._source_previews.values():
+                    merged.update(dict(source_top))
+                self.preview = dict(merged.most_common(self.preview_size))
+            self._last_preview = time.perf_counter()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "elapsed": time.perf_counter() - self.started,
+                "items_done": self.items_done,
+                "items_total": self.items_total,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.bytes_total,
+                "preview": dict(self.preview),
+            }
+
+    def describe(self):
+        """One-line human readable status, e.g. for a UI or terminal."""
+        snap = self.snapshot()
+        elapsed = max(snap["elapsed"], 1e-9)
+        parts = [snap["stage"] or "Working"]
+
+        if snap["items_total"] is not None:
+            parts.append(f"{snap['items_done']:,} / {snap['items_total']:,} files")
+        elif snap["items_done"]:
+            parts.append(f"{snap['items_done']:,} files")
+        if snap["items_done"]:
+            parts.append(f"{snap['items_done'] / elapsed:,.0f} files/s")
+
+        mb_done = snap["bytes_done"] / (1024 * 1024)
+        if snap["bytes_total"]:
+            parts.append(f"{mb_done:,.1f} / {snap['bytes_total'] / (1024 * 1024):,.1f} MB")
+        elif snap["bytes_done"]:
+            parts.append(f"{mb_done:,.1f} MB read")
+        if snap["bytes_done"]:
+            parts.append(f"{mb_done / elapsed:,.1f} MB/s")
+
+        eta = None
+        if snap["bytes_total"] and snap["bytes_done"]:
+            eta = (snap["bytes_total"] - snap["bytes_done"]) * elapsed / snap["bytes_done"]
+        elif snap["items_total"] and snap["items_done"]:
+            eta = (snap["items_total"] - snap["items_done"]) * elapsed / snap["items_done"]
+        if eta is not None:
+            parts.append(f"ETA {eta:,.0f}s")
+
+        return " — ".join(parts)
+
+class NestedProgress:
+    """Progress handle for one of several concurrent sub-operations.
+
+    Work is added to the parent's counters instead of restarting them, and
+    cancelling the parent cancels every nested operation. Each handle's tag
+    preview is kept apart and summed into the parent's.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.preview_size = parent.preview_size
+        self._last_preview = 0.0
+
+    def start(self, stage, items_total=None, bytes_total=None):
+        self.parent.add_totals(items_total or 0, bytes_total or 0)
+        self.parent.check()
+
+    def advance(self, items=0, nbytes=0):
+        self.parent.advance(items, nbytes)
+
+    def check(self):
+        self.parent.check()
+
+    def cancel(self):
+        self.parent.cancel()
+
+    @property
+    def cancelled(self):
+        return self.parent.cancelled
+
+    def wants_preview(self):
+        return time.perf_counter() - self._last_preview >= self.parent.PREVIEW_INTERVAL
+
+    def set_preview(self, tag_counts):
+        self._last_preview = time.perf_counter()
+        self.parent.set_preview(tag_counts, source=self)
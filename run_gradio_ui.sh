@@ -7,7 +7,7 @@ echo "============================================================="
 echo
 echo "This script will:"
 echo "- Create a virtual environment (venv) if it doesn't exist"
-echo "- Install required dependencies (gradio, safetensors, torch CPU)"
+echo "- Install required dependencies (gradio)"
 echo "- Launch the Gradio web interface"
 echo
 echo "Folder: $(pwd)"
@@ -48,11 +48,10 @@ source venv/bin/activate
 pip install --upgrade pip
 
 # Check dependencies (added pytz here so it catches the missing import)
-python -c "import gradio, safetensors, torch, packaging, pytz" 2>/dev/null
+python -c "import gradio, packaging, pytz" 2>/dev/null
 if [ $? -ne 0 ]; then
     echo "Dependencies missing. Installing now..."
-    pip install packaging safetensors gradio pytz
-    pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cpu
+    pip install packaging gradio pytz
     if [ $? -ne 0 ]; then
         echo "ERROR: Dependency installation failed."
         exit 1
@@ -0,0 +1,321 @@
+import errno
+import hashlib
+import json
+import os
+import re
+import struct
+from functools import partial
+from pathlib import Path
+
+# Tensor payloads are copied in fixed-size chunks so memory stays flat
+# regardless of the model size.
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+def read_safetensors_header(path):
+    """Return (header dict, byte offset where the tensor data section starts)."""
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError(f"Not a safetensors file: {path}")
+        header_len = struct.unpack('<Q', prefix)[0]
+        header_bytes = f.read(header_len)
+        if len(header_bytes) != header_len:
+            raise ValueError(f"Truncated safetensors header: {path}")
+    return json.loads(header_bytes), 8 + header_len
+
+def read_safetensors_data_offset(path):
+    """Return where the tensor data section of path starts, reading only the length prefix."""
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+    if len(prefix) != 8:
+        raise ValueError(f"Not a safetensors file: {path}")
+    return 8 + struct.unpack('<Q', prefix)[0]
+
+def safetensors_file_size(header, data_offset):
+    """Size of the complete file a header describes: its data section ends where the last tensor does."""
+    end = max((info["data_offsets"][1] for key, info in header.items() if key != "__metadata__"), default=0)
+    return data_offset + end
+
+def output_alignment(data_offset):
+    """Alignment a rewritten copy gives its data section: whole blocks when the source has them, so reflinks still work."""
+    return REFLINK_BLOCK_SIZE if data_offset % REFLINK_BLOCK_SIZE == 0 else 8
+
+def build_safetensors_header(header, alignment=8):
+    """Serialize a header dict with the length prefix, padded so the data section starts aligned."""
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % alignment)
+    return struct.pack('<Q', len(header_bytes)) + header_bytes
+
+# Reflinks can only share whole filesystem blocks, so the data section has to
+# start on a block boundary in both the source and the output.
+REFLINK_BLOCK_SIZE = 4096
+FICLONERANGE = 0x4020940D
+
+def _reflink_chunk(src_fd, dst_fd, src_offset, dst_offset, length, chunk_size):
+    import fcntl
+    if src_offset % REFLINK_BLOCK_SIZE or dst_offset % REFLINK_BLOCK_SIZE:
+        raise OSError(errno.EINVAL, "Payload is not block aligned")
+    # A zero length clones through to the end of the source file
+    fcntl.ioctl(dst_fd, FICLONERANGE, struct.pack('qQQQ', src_fd, src_offset, 0, dst_offset))
+    return length
+
+def _copy_file_range_chunk(src_fd, dst_fd, src_offset, dst_offset, length, chunk_size):
+    return os.copy_file_range(src_fd, dst_fd, min(length, chunk_size), src_offset, dst_offset)
+
+def _sendfile_chunk(src_fd, dst_fd, src_offset, dst_offset, length, chunk_size):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, src_offset, min(length, chunk_size))
+
+def _buffered_chunk(src_fd, dst_fd, src_offset, dst_offset, length, chunk_size, on_chunk=None):
+    os.lseek(src_fd, src_offset, os.SEEK_SET)
+    chunk = os.read(src_fd, min(length, chunk_size))
+    if not chunk:
+        raise ValueError("Unexpected end of tensor data")
+    if on_chunk is not None:
+        on_chunk(chunk)
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    view = memoryview(chunk)
+    while view:
+        view = view[os.write(dst_fd, view):]
+    return len(chunk)
+
+# Cheapest first: shared extents, in-kernel copy, in-kernel copy through the
+# page cache, and finally a plain read/write loop that works everywhere.
+PAYLOAD_COPY_STRATEGIES = [
+    ("reflink", _reflink_chunk),
+    ("copy_file_range", _copy_file_range_chunk),
+    ("sendfile", _sendfile_chunk),
+    ("buffered", _buffered_chunk),
+]
+# Errors meaning "this strategy can't copy between these files"; anything
+# else (ENOSPC, EIO, ...) is a real failure and is raised. ENOTSOCK is
+# macOS's sendfile, which only writes to sockets.
+UNSUPPORTED_COPY_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.ENOTSOCK}
+
+def copy_payload(src_fd, dst_fd, src_offset, dst_offset, length, chunk_size=COPY_CHUNK_SIZE, on_progress=None,
+                 on_chunk=None):
+    """Copy length bytes between file descriptors and return the name of the strategy that finished the copy.
+    
+    on_progress(nbytes) is called after every chunk; an exception raised from
+    it aborts the copy. Passing on_chunk(data) to see every chunk in order
+    forces the buffered strategy, since the others never bring the bytes into
+    this process.
+    """
+    # Tensor offsets are relative to the data section, so the payload can be
+    # copied byte-for-byte behind a new header.
+    strategies = PAYLOAD_COPY_STRATEGIES
+    if on_chunk is not None:
+        strategies = [("buffered", partial(_buffered_chunk, on_chunk=on_chunk))]
+    copied = 0
+    for name, copy_chunk in strategies:
+        try:
+            while copied < length:
+                n = copy_chunk(src_fd, dst_fd, src_offset + copied, dst_offset + copied,
+                               length - copied, chunk_size)
+                if n == 0:
+                    break
+                copied += n
+                if on_progress is not None:
+                    on_progress(n)
+        except (AttributeError, ImportError):
+            # Not available on this platform
+            continue
+        except OSError as e:
+            if name == "buffered" or e.errno not in UNSUPPORTED_COPY_ERRNOS:
+                raise
+            # Not supported on this filesystem, fall through and continue
+            # from wherever the previous strategy stopped
+            continue
+        if copied >= length:
+            return name
+    raise ValueError("Unexpected end of tensor data")
+
+# Kohya's sshs_legacy_hash covers 64 KiB starting 1 MiB into the file
+LEGACY_HASH_OFFSET = 0x100000
+LEGACY_HASH_SIZE = 0x10000
+MODEL_HASH_KEY = "sshs_model_hash"
+LEGACY_HASH_KEY = "sshs_legacy_hash"
+MODEL_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def known_model_hash(metadata):
+    """The sshs_model_hash a header already carries, or None when it has none (or only a placeholder).
+    
+    It covers the data section alone, so it stays valid for any copy of the
+    payload behind a different header.
+    """
+    value = (metadata or {}).get(MODEL_HASH_KEY)
+    if isinstance(value, str) and MODEL_HASH_PATTERN.match(value) and value != "0" * 64:
+        return value
+    return None
+
+class PayloadHasher:
+    """Kohya-compatible model hashes, fed the data section of a file in order.
+    
+    sshs_model_hash is the SHA-256 of the whole data section. sshs_legacy_hash
+    is the first 8 hex digits of the SHA-256 of the legacy window, located
+    through the data offset of the file being written. With legacy=False no
+    legacy hash is reported, whatever the offset.
+    """
+
+    def __init__(self, data_offset, legacy=True):
+        self._model = hashlib.sha256()
+        self._legacy = hashlib.sha256()
+        # Window start in data-section coordinates; negative when the header
+        # itself reaches into the window
+        self._legacy_start = LEGACY_HASH_OFFSET - data_offset if legacy else -1
+        self._position = 0
+
+    def update(self, chunk):
+        self._model.update(chunk)
+        start = max(self._legacy_start - self._position, 0)
+        end = min(self._legacy_start + LEGACY_HASH_SIZE - self._position, len(chunk))
+        if start < end:
+            self._legacy.update(memoryview(chunk)[start:end])
+        self._position += len(chunk)
+
+    @property
+    def model_hash(self):
+        return self._model.hexdigest()
+
+    @property
+    def legacy_hash(self):
+        if self._legacy_start < 0:
+            return None
+        return self._legacy.hexdigest()[:8]
+
+    def hashes(self):
+        hashes = {MODEL_HASH_KEY: self.model_hash}
+        if self.legacy_hash is not None:
+            hashes[LEGACY_HASH_KEY] = self.legacy_hash
+        return hashes
+
+def hash_payload(path, chunk_size=COPY_CHUNK_SIZE, on_progress=None):
+    """Read the data section of path once and return its PayloadHasher."""
+    _, data_offset = read_safetensors_header(path)
+    hasher = PayloadHasher(data_offset)
+    with open(path, 'rb') as f:
+        f.seek(data_offset)
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+            if on_progress is not None:
+                on_progress(len(chunk))
+    return hasher
+
+def rewrite_safetensors_metadata(src_path, dst_path, metadata, chunk_size=COPY_CHUNK_SIZE, on_progress=None,
+                                 write_hashes=False):
+    """Write src_path to dst_path with a new __metadata__ block, streaming the tensors.
+    
+    With write_hashes, sshs_model_hash / sshs_legacy_hash are computed from the
+    chunks as they are copied and written into the new header afterwards.
+    When metadata already carries a model hash (see known_model_hash) it is
+    kept and only the 64 KiB legacy window is read, so the payload can still
+    be copied without passing through this process. Without write_hashes, a
+    legacy hash that the new data offset invalidates is dropped. Returns the
+    name of the payload copy strategy that was used.
+    """
+    header, data_offset = read_safetensors_header(src_path)
+    metadata = {str(k): str(v) for k, v in metadata.items()}
+    model_hash = known_model_hash(metadata) if write_hashes else None
+    alignment = output_alignment(data_offset)
+    
+    legacy = False
+    if write_hashes:
+        # Fixed-length placeholders keep the header size, and so the data
+        # offset the legacy window depends on, identical to the final header
+        metadata[MODEL_HASH_KEY] = "0" * 64
+        metadata[LEGACY_HASH_KEY] = "0" * 8
+        header["__metadata__"] = metadata
+        # Decided once: dropping the placeholder can pull a header that
+        # covered its own legacy window back under 1 MiB
+        legacy = len(build_safetensors_header(header, alignment)) <= LEGACY_HASH_OFFSET
+        if not legacy:
+            del metadata[LEGACY_HASH_KEY]
+    header["__metadata__"] = metadata
+    prefix = build_safetensors_header(header, alignment)
+    if not write_hashes and LEGACY_HASH_KEY in metadata and len(prefix) != data_offset:
+        # The window moved with the data offset
+        del metadata[LEGACY_HASH_KEY]
+        prefix = build_safetensors_header(header, alignment)
+    
+    hasher = PayloadHasher(len(prefix), legacy) if write_hashes and model_hash is None else None
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        dst.write(prefix)
+        dst.flush()
+        length = os.fstat(src.fileno()).st_size - data_offset
+        strategy = copy_payload(src.fileno(), dst.fileno(), data_offset, len(prefix), length, chunk_size, on_progress,
+                                on_chunk=hasher.update if hasher is not None else None)
+        if write_hashes:
+            if hasher is not None:
+                metadata.update(hasher.hashes())
+            else:
+                metadata[MODEL_HASH_KEY] = model_hash
+                if legacy:
+                    src.seek(data_offset + LEGACY_HASH_OFFSET - len(prefix))
+                    metadata[LEGACY_HASH_KEY] = hashlib.sha256(src.read(LEGACY_HASH_SIZE)).hexdigest()[:8]
+            final_prefix = build_safetensors_header(header, alignment)
+            if len(final_prefix) != len(prefix):
+                raise ValueError("Header size changed while writing model hashes")
+            dst.seek(0)
+            dst.write(final_prefix)
+        return strategy
+
+def header_journal_path(path):
+    return Path(path).with_name(Path(path).name + ".header-journal")
+
+def recover_header_journal(path):
+    """Restore the original header of path if an in-place patch was interrupted."""
+    journal_path = header_journal_path(path)
+    if not journal_path.exists():
+        return False
+    
+    original = journal_path.read_bytes()
+    with open(path, 'r+b') as f:
+        f.write(original)
+        f.flush()
+        os.fsync(f.fileno())
+    journal_path.unlink()
+    return True
+
+def _serialize_with_metadata(header, metadata):
+    header = dict(header)
+    header["__metadata__"] = {str(k): str(v) for k, v in metadata.items()}
+    return json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+def metadata_fits_in_place(header, data_offset, metadata):
+    """True when a header carrying metadata fits in the space before data_offset."""
+    return len(_serialize_with_metadata(header, metadata)) <= data_offset - 8
+
+def patch_safetensors_metadata_in_place(path, metadata):
+    """Overwrite the header of path in place if the new one fits in the existing space.
+    
+    Returns False, leaving the file untouched, when the header does not fit.
+    """
+    recover_header_journal(path)
+    header, data_offset = read_safetensors_header(path)
+    
+    header_bytes = _serialize_with_metadata(header, metadata)
+    capacity = data_offset - 8
+    if len(header_bytes) > capacity:
+        return False
+    # Keep the data section where it is by padding out to the old header length
+    header_bytes += b' ' * (capacity - len(header_bytes))
+    
+    with open(path, 'rb') as f:
+        original = f.read(data_offset)
+    
+    # The journal only becomes visible once fully written, so a crash at any
+    # point leaves either the untouched file or a complete backup to restore.
+    journal_path = header_journal_path(path)
+    tmp_journal_path = journal_path.with_name(journal_path.name + ".tmp")
+    with open(tmp_journal_path, 'wb') as j:
+        j.write(original)
+        j.flush()
+        os.fsync(j.fileno())
+    os.replace(tmp_journal_path, journal_path)
+    
+    with open(path, 'r+b') as f:
+        f.write(struct.pack('<Q', capacity) + header_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    journal_path.unlink()
+    return True
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from dataset_listing import list_dataset_folder
+
+# Rows are looked up in batches to stay under SQLite's bound-variable limit
+SQL_BATCH_SIZE = 500
+# Seconds to wait for another scan of the same folder to finish writing its changes
+LOCK_TIMEOUT = 30
+# Bumped when the stored layout changes; older caches are dropped and rebuilt
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    tags TEXT
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    counts TEXT NOT NULL,
+    image_count INTEGER NOT NULL
+);
+"""
+
+def cache_path_for(cache_dir, folder, prefix=""):
+    """One SQLite file per folder, named prefix + a hash of its absolute path."""
+    key = hashlib.sha1(str(Path(folder).resolve()).encode('utf-8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{prefix}{key}.sqlite"
+
+def _encode_tags(tags):
+    # Tags come from splitting captions on commas, so they never contain one
+    return ",".join(tags) if tags is not None else None
+
+def _decode_tags(text):
+    if text is None:
+        return None
+    return text.split(",") if text else []
+
+def _prepare_schema(conn):
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+    # The version is set in the same transaction as the tables, so concurrent
+    # scans never see a half-migrated cache
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS files")
+            conn.execute("DROP TABLE IF EXISTS totals")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def _fetch_rows(conn, names):
+    rows = {}
+    for i in range(0, len(names), SQL_BATCH_SIZE):
+        batch = names[i:i + SQL_BATCH_SIZE]
+        placeholders = ",".join("?" * len(batch))
+        for name, size, mtime_ns, tag_text in conn.execute(
+                f"SELECT name, size, mtime_ns, tags FROM files WHERE name IN ({placeholders})", batch):
+            rows[name] = (size, mtime_ns, _decode_tags(tag_text))
+    return rows
+
+def scan_with_cache(dataset_path, cache_path, read_tags, workers=1, progress=None, caption_stats=None, stats=None):
+    """Count caption tags, rereading only captions whose (size, mtime_ns) changed.
+
+    read_tags(path) must return the tag list of one caption file, or None when
+    it cannot be read. Returns (Counter, image count, number of captions read,
+    number of captions reused from the cache). caption_stats may pass in the
+    {name: (size, mtime_ns)} of a DatasetListing that was already taken. If progress (an
+    OperationProgress) is cancelled mid-scan the cache is left untouched, and
+    it gets a running top-tag preview while captions are read. stats (a
+    RunStats) gets the "read" and "cache" stage timings.
+
+    Captions are read without holding any lock; only writing the changes back
+    takes the write lock, and raises sqlite3.OperationalError when another
+    scan keeps it longer than the timeout.
+    """
+    started = time.perf_counter()
+    dataset_path = Path(dataset_path)
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if caption_stats is None:
+        caption_stats = list_dataset_folder(dataset_path, with_stats=True).caption_stats
+    current = caption_stats
+
+    conn = sqlite3.connect(cache_path, timeout=LOCK_TIMEOUT, isolation_level=None)
+    try:
+        _prepare_schema(conn)
+        cached = {name: (size, mtime_ns) for name, size, mtime_ns in
+                  conn.execute("SELECT name, size, mtime_ns FROM files")}
+
+        changed = sorted(name for name, stat in current.items() if cached.get(name) != stat)
+        removed = [name for name in cached if name not in current]
+        folder = str(dataset_path)
+        
+        # The preview starts from the cached totals without the captions about to be reread
+        preview_base = Counter()
+        if progress is not None and cached and changed:
+            row = conn.execute("SELECT counts FROM totals WHERE id = 0").fetchone()
+            if row is not None:
+                preview_base.update(json.loads(row[0]))
+                for size, mtime_ns, tags in _fetch_rows(conn, changed + removed).values():
+                    if tags is not None:
+                        preview_base.subtract(tags)
+        
+        def read_changed(name):
+            tags = read_tags(os.path.join(folder, name))
+            if progress is not None:
+                progress.advance(1, current[name][0])
+            return tags
+
+        if progress is not None:
+            progress.start("Reading changed captions", items_total=len(changed),
+                           bytes_total=sum(current[name][0] for name in changed))
+        read_started = time.perf_counter()
+        fresh = []
+        # Tags of the captions read so far, added to the totals in one go when written back
+        fresh_counts = Counter()
+        parallel = workers and workers > 1 and len(changed) > 1
+        with (ThreadPoolExecutor(max_workers=workers) if parallel else nullcontext()) as executor:
+            for tags in executor.map(read_changed, changed) if parallel else map(read_changed, changed):
+                fresh.append(tags)
+                if tags is not None:
+                    fresh_counts.update(tags)
+                if progress is not None and progress.wants_preview():
+                    progress.set_preview(preview_base + fresh_counts if preview_base else fresh_counts)
+        read_time = time.perf_counter() - read_started
+
+        # Write back in one short transaction. Another scan of the folder may
+        # have committed since the stats above were read, so the contribution
+        # backed out is whatever the rows hold now, which keeps the totals
+        # consistent with the rows whichever scan commits last.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT counts, image_count FROM totals WHERE id = 0").fetchone()
+            if row is not None:
+                tag_counter = Counter(json.loads(row[0]))
+                image_count = row[1]
+            else:
+                tag_counter = Counter()
+                image_count = 0
+
+            # No totals row means nothing was ever written, so there is nothing to back out
+            stored = _fetch_rows(conn, changed + removed) if row is not None else {}
+            backed_out = False
+            for size, mtime_ns, tags in stored.values():
+                if tags is not None:
+                    tag_counter.subtract(tags)
+                    image_count -= 1
+                    backed_out = True
+
+            tag_counter.update(fresh_counts)
+            rows = []
+            for name, tags in zip(changed, fresh):
+                if tags is not None:
+                    image_count += 1
+                size, mtime_ns = current[name]
+                rows.append((name, size, mtime_ns, _encode_tags(tags)))
+
+            if backed_out:
+                tag_counter = Counter({tag: count for tag, count in tag_counter.items() if count > 0})
+
+            # An unchanged folder leaves the cache as it is instead of rewriting the totals
+            if changed or removed:
+                conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in removed if name in stored])
+                conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO totals VALUES (0, ?, ?)",
+                             (json.dumps(tag_counter), image_count))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    if stats is not None:
+        stats.add_time("read", read_time)
+        # Comparing stats, backing out stale counts and writing the deltas back
+        stats.add_time("cache", time.perf_counter() - started - read_time)
+        stats.count("caption_bytes", sum(current[name][0] for name in changed))
+    return tag_counter, image_count, len(changed), len(current) - len(changed)
@@ -0,0 +1,84 @@
+import heapq
+import json
+from operator import itemgetter
+
+# Small metadata field describing what was left out of ss_tag_frequency
+TRUNCATION_KEY = "tag_frequency_truncation"
+
+def _entry_size(tag, count):
+    # ss_tag_frequency is a JSON string inside the JSON header, so every
+    # entry is encoded twice: once by json.dumps, then escaped as a string
+    return len(json.dumps(f"{json.dumps(tag)}: {count}")) - 2
+
+def tag_frequency_field_size(tag_freq):
+    """Bytes the ss_tag_frequency value takes inside the serialized header."""
+    return len(json.dumps(json.dumps(tag_freq))) - 2
+
+def top_tags(tag_frequency, limit):
+    """The limit most frequent tags, kept in their original order (ties go to the tag seen first)."""
+    if len(tag_frequency) <= limit:
+        return dict(tag_frequency)
+    kept = {tag for tag, _ in heapq.nlargest(limit, tag_frequency.items(), key=itemgetter(1))}
+    return {tag: count for tag, count in tag_frequency.items() if tag in kept}
+
+def fit_tag_frequency(tag_freq, budget_bytes):
+    """Keep the most frequent tags across all folders whose entries fit in budget_bytes of header.
+
+    Tags are taken strictly by frequency from a heap, so only as many
+    entries as fit are ever ordered. Each folder always keeps its most
+    frequent tag, usually the trigger word.
+    """
+    empty_size = tag_frequency_field_size({folder: {} for folder in tag_freq})
+    remaining = budget_bytes - empty_size
+    kept = {folder: set() for folder in tag_freq}
+    heap = []
+    for folder_index, (folder, tags) in enumerate(tag_freq.items()):
+        if not tags:
+            continue
+        first = max(tags.items(), key=itemgetter(1))[0]
+        kept[folder].add(first)
+        remaining -= _entry_size(first, tags[first])
+        heap.extend((-count, folder_index, position, folder, tag)
+                    for position, (tag, count) in enumerate(tags.items()) if tag != first)
+    heapq.heapify(heap)
+
+    while heap:
+        neg_count, _, _, folder, tag = heap[0]
+        # ", " between entries of the same folder
+        cost = _entry_size(tag, -neg_count) + 2
+        if cost > remaining:
+            break
+        heapq.heappop(heap)
+        kept[folder].add(tag)
+        remaining -= cost
+
+    return {folder: {tag: count for tag, count in tags.items() if tag in kept[folder]}
+            for folder, tags in tag_freq.items()}
+
+def truncation_placeholder(tag_freq):
+    """A truncation record at least as large as the real one, for reserving header space."""
+    return {folder: {"kept": 10 ** 9, "dropped": 10 ** 9, "dropped_count": 10 ** 12} for folder in tag_freq}
+
+def truncate_tag_frequency(tag_freq, max_tags_per_folder=None, budget_bytes=None):
+    """Apply the per-folder tag limit and the header byte budget to a {folder: {tag: count}} table.
+
+    Returns (kept table, truncation record or None when nothing was dropped).
+    The record maps each folder to {"kept", "dropped", "dropped_count"},
+    dropped_count being the tag occurrences left out.
+    """
+    kept = tag_freq
+    if max_tags_per_folder:
+        kept = {folder: top_tags(tags, max_tags_per_folder) for folder, tags in kept.items()}
+    if budget_bytes is not None and tag_frequency_field_size(kept) > budget_bytes:
+        kept = fit_tag_frequency(kept, budget_bytes)
+
+    truncation = {}
+    for folder, tags in tag_freq.items():
+        dropped = len(tags) - len(kept[folder])
+        if dropped:
+            truncation[folder] = {
+                "kept": len(kept[folder]),
+                "dropped": dropped,
+                "dropped_count": sum(tags.values()) - sum(kept[folder].values()),
+            }
+    return kept, truncation or None
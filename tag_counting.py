@@ -0,0 +1,116 @@
+import heapq
+from collections import Counter
+
+class TagCounter:
+    """Counts tags straight into one {tag: count} table.
+
+    Each caption is split, stripped, filtered and counted by Counter.update,
+    whose counting loop runs in C, so no per-caption list or second table is
+    built. Tags keep first-seen order, so to_dict() matches what a Counter
+    fed the same captions would produce.
+    With a normalizer (tag_normalization.TagNormalizer), captions and tags
+    are normalized before counting; add_counts() takes counts as they are.
+    """
+
+    def __init__(self, normalizer=None):
+        self._counts = Counter()
+        self._update = self._counts.update
+        self._normalize = normalizer.lookup if normalizer is not None else None
+        self._clean = self._normalize or str.strip
+
+    def add_caption(self, content):
+        """Parse one comma-separated caption and count its tags."""
+        # Everything here runs inside C loops: split, strip (or a memoized
+        # normalizer lookup), drop empties, count
+        self._update(filter(None, map(self._clean, content.split(','))))
+
+    def add_tags(self, tags):
+        if self._normalize is not None:
+            tags = filter(None, map(self._normalize, tags))
+        self._update(tags)
+
+    def add_counts(self, tag_counts):
+        """Add a {tag: count} mapping, e.g. the result of another counter."""
+        self._update(tag_counts)
+
+    def merge(self, other):
+        self.add_counts(other.to_dict())
+
+    def __len__(self):
+        return len(self._counts)
+
+    def to_dict(self):
+        """The live {tag: count} table; it keeps changing if more captions are added."""
+        return self._counts
+
+class SpaceSavingCounter:
+    """Approximate heavy-hitter counter with a fixed number of slots (Space-Saving).
+
+    Memory is bounded by `capacity` tracked tags no matter how long the tail
+    is. Every reported count is at most `total / capacity` too high, and each
+    tag's own overestimate is tracked in `errors()`. Any tag that occurs more
+    than `total / capacity` times is guaranteed to be tracked. Tags are
+    normalized before counting when a normalizer is given, memoizing at most
+    `capacity` spellings so the memory bound still holds.
+    """
+
+    def __init__(self, capacity, normalizer=None):
+        self.capacity = max(1, int(capacity))
+        self._normalize = normalizer.bounded_lookup(self.capacity) if normalizer is not None else None
+        self._clean = self._normalize or str.strip
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # One (count, tag) entry per tracked tag; counts may be stale-low and
+        # are refreshed lazily when the entry reaches the top of the heap
+        self._heap = []
+
+    def add_caption(self, content):
+        self._add(filter(None, map(self._clean, content.split(','))))
+
+    def add_tags(self, tags):
+        if self._normalize is not None:
+            tags = filter(None, map(self._normalize, tags))
+        self._add(tags)
+
+    def _add(self, tags):
+        counts = self._counts
+        for tag in tags:
+            self.total += 1
+            if tag in counts:
+                counts[tag] += 1
+            elif len(counts) < self.capacity:
+                counts[tag] = 1
+                self._errors[tag] = 0
+                heapq.heappush(self._heap, (1, tag))
+            else:
+                self._replace_min(tag)
+
+    def _replace_min(self, tag):
+        heap = self._heap
+        counts = self._counts
+        while True:
+            count, victim = heap[0]
+            current = counts[victim]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del counts[victim]
+        del self._errors[victim]
+        counts[tag] = count + 1
+        self._errors[tag] = count
+        heapq.heapreplace(heap, (count + 1, tag))
+
+    def __len__(self):
+        return len(self._counts)
+
+    def error_bound(self):
+        """Guaranteed upper bound on how far any reported count can be too high."""
+        return self.total // self.capacity
+
+    def top(self, n):
+        """Return the n highest {tag: count} entries, highest first."""
+        return dict(heapq.nlargest(n, self._counts.items(), key=lambda item: item[1]))
+
+    def errors(self):
+        return dict(self._errors)
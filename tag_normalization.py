@@ -0,0 +1,171 @@
+import csv
+import json
+import re
+from pathlib import Path
+
+# Raw spellings remembered per normalizer before the memo starts over
+MEMO_LIMIT = 1 << 20
+# Alias files with one "alias,canonical" pair per line
+ALIAS_FILE_EXTENSIONS = {".csv": ",", ".tsv": "\t"}
+
+class _Memo(dict):
+    """raw caption segment -> normalized tag ("" when dropped), filled in on first lookup."""
+
+    __slots__ = ("_normalize", "_limit")
+
+    def __init__(self, normalize, limit=MEMO_LIMIT):
+        super().__init__()
+        self._normalize = normalize
+        self._limit = max(1, limit)
+
+    def __missing__(self, raw):
+        tag = self._normalize(raw)
+        if len(self) >= self._limit:
+            self.clear()
+        self[raw] = tag
+        return tag
+
+class TagNormalizer:
+    """Cleans tags while they are counted, so `Blue_Hair` and `blue hair` end up as one tag.
+
+    Steps, in order: strip, lowercase, underscores to spaces (with runs of
+    whitespace collapsed), regex rewrites, aliases, blacklist. Aliases and
+    blacklist entries go through the same case and underscore handling, and
+    alias chains are resolved up front. Everything is compiled once and each
+    raw spelling is normalized only the first time it is seen: lookup(raw)
+    is a dict lookup afterwards, returning "" for dropped tags.
+    """
+
+    def __init__(self, lowercase=True, underscores=True, aliases=None, blacklist=None, rewrites=None):
+        self._config = (lowercase, underscores, dict(aliases or {}), list(blacklist or ()),
+                        [tuple(rule) for rule in rewrites or ()])
+        self.lowercase = lowercase
+        self._table = str.maketrans("_", " ") if underscores else None
+        self.rewrites = [(re.compile(pattern), replacement) for pattern, replacement in self._config[4]]
+        self.aliases = self._compile_aliases(self._config[2])
+        self.blacklist = frozenset(filter(None, map(self._base, self._config[3])))
+        self._memo = _Memo(self._normalize)
+        self.lookup = self._memo.__getitem__
+
+    def __reduce__(self):
+        # Rebuilt from the rules in worker processes; the memo stays behind
+        return (TagNormalizer, self._config)
+
+    def _base(self, tag):
+        tag = tag.strip()
+        if self.lowercase:
+            tag = tag.lower()
+        if self._table is not None:
+            tag = " ".join(tag.translate(self._table).split())
+        return tag
+
+    def _compile_aliases(self, aliases):
+        table = {self._base(alias): self._base(canonical) for alias, canonical in aliases.items()}
+        # Entries that only differ by case or underscores are already handled
+        table = {alias: canonical for alias, canonical in table.items() if alias != canonical}
+        resolved = {}
+        for alias, target in table.items():
+            seen = {alias}
+            while target in table:
+                if target in seen:
+                    raise ValueError(f"alias cycle through {alias!r}")
+                seen.add(target)
+                target = table[target]
+            resolved[alias] = target
+        return resolved
+
+    def _normalize(self, raw):
+        tag = self._base(raw)
+        if self.rewrites:
+            for pattern, replacement in self.rewrites:
+                tag = pattern.sub(replacement, tag)
+            tag = tag.strip()
+        tag = self.aliases.get(tag, tag)
+        return "" if tag in self.blacklist else tag
+
+    def bounded_lookup(self, limit):
+        """A lookup with its own memo of at most limit spellings, for counters whose memory must stay bounded."""
+        return _Memo(self._normalize, limit).__getitem__
+
+    def normalize(self, tag):
+        """The normalized form of one tag, or None when it is blacklisted or empty."""
+        return self.lookup(tag) or None
+
+    def normalize_tags(self, tags):
+        return list(filter(None, map(self.lookup, tags)))
+
+    def normalize_counts(self, tag_counts):
+        """Fold a raw {tag: count} mapping into normalized tags, keeping first-seen order."""
+        merged = {}
+        lookup = self.lookup
+        for tag, count in tag_counts.items():
+            tag = lookup(tag)
+            if tag:
+                merged[tag] = merged.get(tag, 0) + count
+        return merged
+
+def read_alias_file(path):
+    """Read "alias,canonical" lines (tab-separated for .tsv); blank lines and # comments are skipped."""
+    path = Path(path)
+    aliases = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f, delimiter=ALIAS_FILE_EXTENSIONS.get(path.suffix.lower(), ",")):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{path.name}: alias line without a canonical tag: {','.join(row)}")
+            aliases[row[0]] = row[1]
+    return aliases
+
+def read_tag_list(path):
+    """Read tags listed one per line or comma-separated; # starts a comment line."""
+    tags = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.lstrip().startswith("#"):
+                tags.extend(tag for tag in line.split(",") if tag.strip())
+    return tags
+
+def load_tag_rules(path):
+    """Build a TagNormalizer from a rules file.
+
+    A .csv/.tsv file is read as an alias map. A .json file may set
+    "lowercase" and "underscores" (both default to true), "aliases" (an
+    object, or the path of an alias file), "blacklist" (a list, or the path
+    of a tag list file) and "rewrites" (a list of [pattern, replacement]
+    pairs). Paths are relative to the rules file.
+    """
+    path = Path(path)
+    if path.suffix.lower() in ALIAS_FILE_EXTENSIONS:
+        return TagNormalizer(aliases=read_alias_file(path))
+
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict):
+        raise ValueError(f"{path.name}: expected a JSON object of tag rules")
+    unknown = set(rules) - {"lowercase", "underscores", "aliases", "blacklist", "rewrites"}
+    if unknown:
+        raise ValueError(f"{path.name}: unknown tag rule(s): {', '.join(sorted(unknown))}")
+
+    aliases = rules.get("aliases") or {}
+    if isinstance(aliases, str):
+        aliases = read_alias_file(path.parent / aliases)
+    blacklist = rules.get("blacklist") or []
+    if isinstance(blacklist, str):
+        blacklist = read_tag_list(path.parent / blacklist)
+    rewrites = rules.get("rewrites") or []
+    if any(not isinstance(rule, list) or len(rule) != 2 for rule in rewrites):
+        raise ValueError(f"{path.name}: rewrites must be [pattern, replacement] pairs")
+    try:
+        return TagNormalizer(bool(rules.get("lowercase", True)), bool(rules.get("underscores", True)),
+                             aliases, blacklist, rewrites)
+    except re.error as e:
+        raise ValueError(f"{path.name}: invalid rewrite pattern: {e}") from e
+    except ValueError as e:
+        raise ValueError(f"{path.name}: {e}") from e
+
+def make_tag_normalizer(normalize=False, rules_path=None):
+    """The normalizer asked for by the --normalize-tags / --tag-rules options, or None to count tags as written."""
+    if rules_path:
+        return load_tag_rules(rules_path)
+    return TagNormalizer() if normalize else None
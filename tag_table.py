@@ -0,0 +1,49 @@
+import heapq
+
+# Sort keys accepted by query_tag_page
+SORT_COUNT_DESC = "count_desc"
+SORT_COUNT_ASC = "count_asc"
+SORT_NAME_ASC = "name_asc"
+SORT_NAME_DESC = "name_desc"
+
+def query_tag_page(tag_counts, search="", min_count=0, sort=SORT_COUNT_DESC, page=1, page_size=50):
+    """Filter, sort and slice a {tag: count} table down to one page.
+
+    Returns (rows, page, page_count, matched) where rows is a list of
+    [tag, count] pairs and page is clamped to the valid range.
+    """
+    page_size = max(1, int(page_size))
+    needle = search.strip().lower()
+    items = [(tag, count) for tag, count in tag_counts.items()
+             if count >= min_count and (not needle or needle in tag.lower())]
+
+    matched = len(items)
+    page_count = max(1, -(-matched // page_size))
+    page = min(max(1, int(page)), page_count)
+    end = page * page_size
+
+    # Only the first `end` entries are ever needed, so partial selection with
+    # a heap beats sorting the whole table on early pages
+    if sort == SORT_COUNT_ASC:
+        ordered = heapq.nsmallest(end, items, key=lambda item: (item[1], item[0]))
+    elif sort == SORT_NAME_ASC:
+        ordered = heapq.nsmallest(end, items, key=lambda item: item[0].lower())
+    elif sort == SORT_NAME_DESC:
+        ordered = heapq.nlargest(end, items, key=lambda item: item[0].lower())
+    else:
+        ordered = heapq.nsmallest(end, items, key=lambda item: (-item[1], item[0]))
+
+    rows = [[tag, count] for tag, count in ordered[end - page_size:end]]
+    return rows, page, page_count, matched
+
+def summarize_tags(tag_counts):
+    counts = sorted(tag_counts.values())
+    if not counts:
+        return {"unique": 0, "total": 0, "max": 0, "median": 0, "singletons": 0}
+    return {
+        "unique": len(counts),
+        "total": sum(counts),
+        "max": counts[-1],
+        "median": counts[len(counts) // 2],
+        "singletons": sum(1 for count in counts if count == 1),
+    }
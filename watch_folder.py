@@ -0,0 +1,202 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from safetensors_io import read_safetensors_header, safetensors_file_size
+from batch_inject import find_dataset_for, run_job
+
+# A new file is injected once it has gone this many seconds without changing
+DEBOUNCE_SECONDS = 1.0
+# Seconds between directory listings when inotify is not available
+POLL_INTERVAL = 1.0
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+def is_watched_name(name):
+    # Dotfiles cover the hidden temp files outputs are written through
+    return name.endswith(".safetensors") and not name.startswith(".")
+
+def list_watched_files(folder):
+    """Return {name: (size, mtime_ns)} for the LoRAs directly inside folder."""
+    stats = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if is_watched_name(entry.name):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if entry.is_file():
+                    stats[entry.name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+class InotifyWatcher:
+    """Reports the names of files written or moved into a folder, using Linux inotify through libc."""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(self.folder), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"Cannot watch {self.folder}")
+
+    def read_events(self, timeout):
+        """Wait up to timeout seconds and return the names that changed."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so fall back to one listing of the folder
+                names.extend(list_watched_files(self.folder))
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingWatcher:
+    """Fallback watcher that lists the folder every POLL_INTERVAL seconds and reports new or changed LoRAs."""
+
+    def __init__(self, folder, interval=POLL_INTERVAL):
+        self.folder = Path(folder)
+        self.interval = interval
+        self._seen = list_watched_files(self.folder)
+
+    def read_events(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = list_watched_files(self.folder)
+        changed = [name for name, stat in current.items() if self._seen.get(name) != stat]
+        self._seen = current
+        return changed
+
+    def close(self):
+        pass
+
+def open_watcher(folder, polling=False):
+    """inotify on Linux, polling everywhere else (or when asked to)."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folder)
+
+def is_complete_lora(path):
+    """True once the file is as long as its header says, i.e. the writer has finished the payload."""
+    try:
+        header, data_offset = read_safetensors_header(path)
+        return os.path.getsize(path) >= safetensors_file_size(header, data_offset)
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        return False
+
+class FolderWatcher:
+    """Scan + inject every LoRA that lands in a folder, a few at a time, in the background.
+
+    Each LoRA is paired with its dataset by batch_inject.find_dataset_for.
+    A file waits until it has been quiet for debounce seconds and is
+    complete; events for a file that is already being injected are held back
+    until that run ends. Outputs that are already up to date are skipped, so
+    rewriting a file with the same tensors costs a header read.
+    """
+
+    def __init__(self, folder, output_dir=None, workers=2, debounce=DEBOUNCE_SECONDS, polling=False,
+                 on_result=None, **job_options):
+        """job_options are passed on to batch_inject.run_job (scan_workers, approximate_top, write_hashes, ...)."""
+        self.folder = Path(folder).resolve()
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.debounce = debounce
+        self.polling = polling
+        self.on_result = on_result
+        self.job_options = job_options
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._in_flight = set()
+
+    def stop(self):
+        self._stop.set()
+
+    def queue(self, names):
+        now = time.monotonic()
+        with self._lock:
+            for name in names:
+                if is_watched_name(name):
+                    self._pending[name] = now
+
+    def _ready(self):
+        """Pop the pending files that have been quiet long enough and are complete."""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for name, last_event in list(self._pending.items()):
+                if name in self._in_flight or now - last_event < self.debounce:
+                    continue
+                path = self.folder / name
+                del self._pending[name]
+                # An incomplete file is still being written, and its next write queues it again
+                if path.exists() and is_complete_lora(path):
+                    self._in_flight.add(name)
+                    ready.append(name)
+        return ready
+
+    def _run(self, name):
+        lora_path = self.folder / name
+        try:
+            job = {"lora": str(lora_path), "dataset": str(find_dataset_for(lora_path))}
+            result = run_job(job, self.output_dir, **self.job_options)
+        except Exception as e:
+            result = {"lora": str(lora_path), "dataset": None, "output": None, "status": f"[ERROR] Error: {e}",
+                      "skipped": False, "bytes": 0, "seconds": 0.0, "timings": []}
+        finally:
+            with self._lock:
+                self._in_flight.discard(name)
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def run(self, existing=False, watcher=None):
+        """Watch until stop() is called (or Ctrl+C). With existing, LoRAs already in the folder are queued too."""
+        watcher = watcher or open_watcher(self.folder, self.polling)
+        if existing:
+            self.queue(list_watched_files(self.folder))
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self._stop.is_set():
+                self.queue(watcher.read_events(min(self.debounce, 0.5)))
+                for name in self._ready():
+                    executor.submit(self._run, name)
+        finally:
+            # Running injections finish (their outputs are swapped in atomically), queued ones are dropped
+            executor.shutdown(wait=True, cancel_futures=True)
+            watcher.close()